@@ -1,35 +1,112 @@
 # minimal_minecraft_pygame.py
-# Requirements: Python 3.10+ and pygame
-# pip install pygame
-import sys, os, math, random, time
+# Requirements: Python 3.10+, pygame and numpy
+# pip install pygame numpy
+import sys, os, math, random, time, threading, json, argparse, tracemalloc, csv, mmap, struct, multiprocessing, heapq
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
 import pygame
+import numpy as np
 
 # ---------- Config ----------
 WIDTH, HEIGHT = 960, 540
 FOV_DEG = 80
 NEAR_PLANE = 0.05
-FAR_PLANE = 100.0
+FAR_PLANE = 192.0
 MOUSE_SENS = 0.15
 MOVE_SPEED = 6.0
-FLY_MODE = True          # True = noclip fly; False = gravity/jump (basic)
+FLY_MODE = True          # True = noclip fly; False = gravity/jump, colliding with blocks
 GRAVITY = 18.0
 JUMP_SPEED = 7.5
+PLAYER_WIDTH = 0.6        # collision box of the walking player, in blocks; the camera sits PLAYER_EYE above its base
+PLAYER_HEIGHT = 1.8
+PLAYER_EYE = 1.6
 AIR_FRICTION = 0.90
 WORLD_SEED = 1337
 RENDER_RADIUS = 24        # Manhattan-ish radius in blocks around camera for rendering
+LOD_MID_RADIUS = 64       # beyond RENDER_RADIUS, chunks out to here are drawn with LOD_MID_STEP columns merged
+LOD_FAR_RADIUS = 128      # and out to here with LOD_FAR_STEP columns merged (the view distance)
+LOD_MID_STEP = 2
+LOD_FAR_STEP = 4
+LOD_BUILDS_PER_FRAME = 4  # coarse meshes built per frame, nearest first
+ADAPTIVE_RADIUS = True    # let RenderDistance resize the render radius (and LOD rings) to hold FPS_CAP
+RADIUS_MIN, RADIUS_MAX = 12, 48  # blocks; a sparse world keeps every chunk within the radius cached (World.retain)
+RADIUS_STEP = 4
+RADIUS_WINDOW = 30        # redrawn frames looked at per decision
+RADIUS_SHRINK_ABOVE = 0.9 # shrink when the window's 75th percentile frame takes more than this share of 1/FPS_CAP,
+RADIUS_GROW_BELOW = 0.5   # grow when it takes less than this share
 BUILD_REACH = 6.0
 FPS_CAP = 60
+PROFILE_HISTORY = 120     # frames shown by the F3 profiler overlay
+RENDER_BACKEND = "painter"  # "painter": sorted pygame polygons; "zbuffer": NumPy rasteriser with a depth buffer
+RASTER_BATCH = 1 << 16      # fragments rasterised per NumPy batch by the zbuffer backend
+
+# World storage: fixed-size chunk columns of CHUNK_SIZE x CHUNK_SIZE x WORLD_HEIGHT
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+HEIGHT_SHIFT = 7
+WORLD_HEIGHT = 1 << HEIGHT_SHIFT
+CHUNK_VOLUME = CHUNK_SIZE * CHUNK_SIZE * WORLD_HEIGHT
+EMPTY_COLUMN = bytes(WORLD_HEIGHT)
+SECTION_SHIFT = 4              # chunks split vertically into 16-high sections for cave culling
+SECTIONS = WORLD_HEIGHT >> SECTION_SHIFT
+BRICK_SHIFT = 2                # occupancy map: solid block counts per 4x4x4 brick
+BRICK_SIZE = 1 << BRICK_SHIFT
+BRICK_VOLUME = BRICK_SIZE ** 3
+BRICKS_SHIFT = CHUNK_SHIFT - BRICK_SHIFT          # bricks per chunk side, as a shift
+BRICKS_HEIGHT_SHIFT = HEIGHT_SHIFT - BRICK_SHIFT  # bricks per column, as a shift
+EMPTY_OCCUPANCY = bytes(1 << (2*BRICKS_SHIFT + BRICKS_HEIGHT_SHIFT))
+HEIGHTMAP_CACHE_CHUNKS = 4096  # chunk heightmaps kept in memory (256 bytes each)
+GEN_WORKERS = 2                # background chunk generation threads
+GEN_INSTALL_PER_FRAME = 2      # finished chunks installed per frame (each one triggers remeshing)
+MESH_WORKERS = 2               # processes building chunk meshes in the game (0 = build on the main thread)
+MESH_INSTALL_PER_FRAME = 4     # finished chunk meshes installed per frame
+
+# Saves: edited chunks only, in region files of REGION_SIZE x REGION_SIZE chunks
+SAVE_DIR = os.path.join(os.path.expanduser("~"), ".minimal_minecraft", "world")  # per user, not the current directory
+REGION_SHIFT = 5
+REGION_SIZE = 1 << REGION_SHIFT
+
+# Sparse worlds keep only player edits; chunk arrays are derived from the seed when needed
+SPARSE_WORLD = False
+SPARSE_DENSE_EDITS = 256       # edits after which a chunk's overlay becomes the chunk array itself (a dict entry costs ~80 bytes)
+SPARSE_CACHE_CHUNKS = 64       # derived chunk arrays kept beyond the region being drawn (least recently used dropped)
 
 # Colors per block id
-# 0=air, 1=grass, 2=dirt, 3=stone, 4=wood, 5=leaves
+# 0=air, 1=grass, 2=dirt, 3=stone, 4=wood, 5=leaves, 6=lamp, 7=sand,
+# 8=water source, 9..8+WATER_REACH=flowing water that many blocks from its source
+WATER = 8
+WATER_REACH = 7
 BLOCK_COLORS = {
     1: (100, 170, 80),
     2: (134, 96, 67),
     3: (128, 128, 128),
     4: (102, 81, 60),
     5: (64, 160, 64),
+    6: (255, 214, 120),
+    7: (219, 207, 150),
+    **{WATER + d: (60, 100, 215) for d in range(WATER_REACH + 1)},
 }
-BLOCK_NAMES = {1: "Grass", 2: "Dirt", 3: "Stone", 4: "Wood", 5: "Leaves"}
+PASSABLE = {WATER + d for d in range(WATER_REACH + 1)}  # ids the player walks through
+SOLID = bytes(0 < bid and bid not in PASSABLE for bid in range(256))
+BLOCK_NAMES = {1: "Grass", 2: "Dirt", 3: "Stone", 4: "Wood", 5: "Leaves", 6: "Lamp", 7: "Sand", 8: "Water"}
+
+# Scheduled block updates (see BlockTicks): sand falls, water flows
+TICK_RATE = 20            # block ticks per second
+TICK_BUDGET = 64          # block updates run per tick at most; the rest wait for the next tick
+TICK_CATCHUP = 2          # ticks run per frame at most after a slow frame
+TICK_DELAY = {7: 2, **{WATER + d: 5 for d in range(WATER_REACH + 1)}}  # ticks from a change to the update
+
+# Voxel light, 0..MAX_LIGHT per channel: skylight is MAX_LIGHT in air open to the sky and
+# block light MAX_LIGHT - 1 at most, both losing one level per step through air. Faces take
+# the light of the air cell in front of them
+MAX_LIGHT = 15
+BLOCK_LIGHT = {6: 14}  # light emitted by a block id
+LIGHT_FALLOFF = 0.85   # brightness factor per level below MAX_LIGHT
+LIGHT_FLOOR = 0.15     # brightness of unlit faces
+LIGHT_STEP = 4         # light levels per brightness band: faces in one band share a colour, so they still merge
+SKY_COLUMN = bytes([MAX_LIGHT << 4]) * WORLD_HEIGHT  # packed light of a column open to the sky
 
 # Face normals and order: +X, -X, +Y, -Y, +Z, -Z
 FACE_DIRS = [
@@ -104,15 +181,73 @@ class Camera:
             pass
         return (sx, sy)
 
+    def view_matrix(self):
+        # Rotation taking world offsets to camera space; same maths as rotate_point, built once per frame
+        cy, sy = math.cos(math.radians(self.yaw)), math.sin(math.radians(self.yaw))
+        cp, sp = math.cos(math.radians(self.pitch)), math.sin(math.radians(self.pitch))
+        return np.array([
+            [cy,     0.0, -sy],
+            [-sp*sy, cp,  -sp*cy],
+            [cp*sy,  sp,  cp*cy],
+        ])
+
+    def transform_points(self, pts, view):
+        # (..., 3) world points -> camera space
+        return (pts - np.array((self.x, self.y, self.z))) @ view.T
+
+    def project_points(self, pts_cam):
+        # (..., 3) camera-space points -> (..., 2) screen points and a mask of points past the near plane
+        z = pts_cam[..., 2]
+        front = z > NEAR_PLANE
+        inv_z = self.f / np.where(front, z, 1.0)
+        scr = np.empty(pts_cam.shape[:-1] + (2,))
+        scr[..., 0] = WIDTH*0.5 + pts_cam[..., 0] * inv_z
+        scr[..., 1] = HEIGHT*0.5 - pts_cam[..., 1] * inv_z
+        return scr, front
+
+    def boxes_visible(self, lo, hi, view):
+        # Conservative frustum test for (k,3) axis-aligned boxes: a box is culled only when
+        # all 8 of its corners lie outside one of the six frustum planes
+        tan_v = HEIGHT*0.5 / self.f
+        tan_h = WIDTH*0.5 / self.f
+        sel = np.array([[(i >> a) & 1 for a in range(3)] for i in range(8)], dtype=bool)
+        corners = np.where(sel, hi[:, None, :], lo[:, None, :])
+        c = self.transform_points(corners, view)
+        x, y, z = c[..., 0], c[..., 1], c[..., 2]
+        outside = ((z < NEAR_PLANE).all(axis=1) | (z > FAR_PLANE).all(axis=1) |
+                   (x > z*tan_h).all(axis=1) | (x < -z*tan_h).all(axis=1) |
+                   (y > z*tan_v).all(axis=1) | (y < -z*tan_v).all(axis=1))
+        return ~outside
+
 # ---------- World generation (value noise + simple biome) ----------
 class World:
-    def __init__(self, seed=WORLD_SEED):
+    def __init__(self, seed=WORLD_SEED, sparse=SPARSE_WORLD):
         self.seed = seed
-        self.blocks = {}  # (x,y,z) -> block_id (omit air)
+        # Dense worlds keep every generated chunk here. Sparse worlds only cache derived chunks
+        # here (the retained region plus SPARSE_CACHE_CHUNKS more, least recently used dropped
+        # first) and keep player edits in self.edits
+        self.chunks = OrderedDict()  # (cx,cz) -> bytearray of block ids, one byte per block (0 = air)
+        self.sparse = sparse
+        self.edits = {}   # (cx,cz) -> {block index: block id}, or the whole chunk array once edited a lot; sparse worlds only
+        self._retained = frozenset()  # (cx,cz) a sparse world never drops, see retain()
+        self._occupancy = {}  # (cx,cz) -> brick counts, see occupancy()
+        self._solid_tops = {}  # (cx,cz) -> solid_top()
+        self._light = {}  # (cx,cz) -> packed light, see light()
+        # Objects with block_changed(x,y,z), chunk_changed(cx,cz) (bulk edits), chunk_loaded(cx,cz)
+        # and light_changed(cx,cz)
+        self.observers = []
+        self.generated = set()  # (cx,cz) of every chunk generated or loaded so far
+        self._region_bounds, self._region = None, frozenset()
+        self.store = None       # RegionStore holding edited chunks, if the world is saved
+        self.modified = set()   # (cx,cz) edited since the last save
+        self.version = 0        # bumped by every block edit and chunk install, for whole-frame caches
         self.rng = random.Random(seed)
         self._perm = list(range(256))
         self.rng.shuffle(self._perm)
         self._perm += self._perm
+        self._perm_arr = np.array(self._perm, dtype=np.int64)
+        self._heightmaps = OrderedDict()  # (cx,cz) -> bytes, LRU bounded by HEIGHTMAP_CACHE_CHUNKS
+        self._heightmaps_lock = threading.Lock()  # chunks may be generated on worker threads
 
     def hash(self, x, z):
         # Deterministic pseudo-random based on integer lattice
@@ -144,58 +279,696 @@ class World:
             freq *= lacunarity
         return total
 
+    def value_noise2d_grid(self, xs, zs, freq=1.0):
+        # value_noise2d over integer coordinate arrays (broadcast together);
+        # same operations in the same order, so results are bit-identical
+        x = xs * freq
+        z = zs * freq
+        xi, zi = np.floor(x), np.floor(z)
+        xf, zf = x - xi, z - zi
+        xi, zi = xi.astype(np.int64), zi.astype(np.int64)
+        perm = self._perm_arr
+        h00 = perm[(xi   + perm[zi & 255])     & 255] / 255.0
+        h10 = perm[(xi+1 + perm[zi & 255])     & 255] / 255.0
+        h01 = perm[(xi   + perm[(zi+1) & 255]) & 255] / 255.0
+        h11 = perm[(xi+1 + perm[(zi+1) & 255]) & 255] / 255.0
+        u, v = self.smoothstep(xf), self.smoothstep(zf)
+        x1 = h00*(1-u) + h10*u
+        x2 = h01*(1-u) + h11*u
+        return x1*(1-v) + x2*v
+
+    def fbm_grid(self, xs, zs, octaves=5, lacunarity=2.0, gain=0.5):
+        amp, freq, total = 1.0, 0.01, 0.0
+        for _ in range(octaves):
+            total = total + amp * self.value_noise2d_grid(xs, zs, freq)
+            amp *= gain
+            freq *= lacunarity
+        return total
+
+    def heightmap(self, cx, cz):
+        # Surface heights of a whole chunk, index (lx << CHUNK_SHIFT | lz)
+        key = (cx, cz)
+        with self._heightmaps_lock:
+            hm = self._heightmaps.get(key)
+            if hm is not None:
+                self._heightmaps.move_to_end(key)
+                return hm
+        xs = np.arange(cx << CHUNK_SHIFT, (cx + 1) << CHUNK_SHIFT, dtype=np.int64)[:, None]
+        zs = np.arange(cz << CHUNK_SHIFT, (cz + 1) << CHUNK_SHIFT, dtype=np.int64)[None, :]
+        hills = self.fbm_grid(xs, zs, octaves=5)
+        h = 32 + (hills * 18).astype(np.int64)  # same scaling as fbm-based height: base + int(hills*18)
+        hm = np.clip(h, 8, 80).astype(np.uint8).tobytes()
+        with self._heightmaps_lock:
+            self._heightmaps[key] = hm
+            if len(self._heightmaps) > HEIGHTMAP_CACHE_CHUNKS:
+                self._heightmaps.popitem(last=False)
+        return hm
+
     def height_at(self, x, z):
-        base = 32
-        hills = self.fbm(x, z, octaves=5)  # ~0..something
-        h = base + int(hills * 18)  # scale elevation
-        return max(8, min(80, h))
-
-    def ensure_column(self, x, z):
-        # Generate a vertical column if not present
-        # Only generate if empty at surface; cheap guard
-        top_y = self.height_at(x, z)
-        key = (x, top_y, z)
-        if key in self.blocks:  # already generated/modified
-            return
-        # Terrain layering
-        for y in range(0, top_y - 4):
-            self.blocks[(x, y, z)] = 3  # stone
-        for y in range(top_y - 4, top_y - 1):
-            self.blocks[(x, y, z)] = 2  # dirt
-        self.blocks[(x, top_y - 1, z)] = 1  # grass
-        # Occasional tree on grass
-        rng_val = self.hash(x*13, z*17)
-        if rng_val > 0.86 and top_y < 70:
-            self._plant_tree(x, top_y, z)
-
-    def _plant_tree(self, x, y, z):
+        return self.heightmap(x >> CHUNK_SHIFT, z >> CHUNK_SHIFT)[(x & CHUNK_MASK) << CHUNK_SHIFT | (z & CHUNK_MASK)]
+
+    def ensure_chunk(self, cx, cz):
+        chunk = self.chunks.get((cx, cz))
+        if chunk is None:
+            if self.sparse:
+                return self._materialise(cx, cz)
+            chunk = self.install_chunk(cx, cz, self.load_chunk(cx, cz))
+        return chunk
+
+    def chunk_data(self, cx, cz):
+        # Block array of a chunk, or None if it is not generated; sparse worlds derive it on demand
+        chunk = self.chunks.get((cx, cz))
+        if self.sparse:
+            if chunk is None: return self._materialise(cx, cz)
+            self.chunks.move_to_end((cx, cz))
+        return chunk
+
+    def retain(self, keys):
+        # Sparse worlds: chunks the caller is drawing (ChunkMeshCache.retain), kept however long
+        # ago they were used, so a large render radius does not re-derive its own chunks
+        self._retained = keys
+        self._evict()
+
+    def _materialise(self, cx, cz):
+        # Sparse worlds: rebuild a chunk array from the seed (or save) plus its edit overlay
+        overlay = self.edits.get((cx, cz), {})
+        if isinstance(overlay, bytearray):
+            data = overlay
+        else:
+            data = self.load_chunk(cx, cz)
+            for index, bid in overlay.items():
+                data[index] = bid
+        self.chunks[(cx, cz)] = data
+        self._evict()
+        return data
+
+    def _record_edits(self, key, chunk, indices, ids):
+        # Sparse worlds: add edits already written to chunk to its overlay. Past SPARSE_DENSE_EDITS
+        # the overlay is chunk itself, which later edits then update in place
+        overlay = self.edits.setdefault(key, {})
+        if isinstance(overlay, bytearray): return
+        if len(overlay) + len(indices) > SPARSE_DENSE_EDITS:
+            self.edits[key] = chunk
+        else:
+            overlay.update(zip(np.asarray(indices).tolist(), np.asarray(ids).tolist()))
+
+    def _evict(self):
+        # Sparse worlds: drop the least recently used chunks outside the retained region
+        excess = len(self.chunks) - len(self._retained) - SPARSE_CACHE_CHUNKS
+        if not self.sparse or excess <= 0: return
+        for key in [k for k in self.chunks if k not in self._retained][:excess]:
+            del self.chunks[key]
+            self._occupancy.pop(key, None)
+            self._solid_tops.pop(key, None)
+            self._light.pop(key, None)
+
+    def load_chunk(self, cx, cz):
+        # Saved chunk if there is one, else fresh terrain; safe to run on a worker thread
+        if self.store is not None:
+            data = self.store.read(cx, cz)
+            if data is not None:
+                return data
+        return self._generate_chunk(cx, cz)
+
+    def save(self):
+        # Write only the chunks edited since the last save; returns how many were written
+        if self.store is None: return 0
+        for key in sorted(self.modified):
+            self.store.write(key[0], key[1], self.ensure_chunk(*key))
+        count = len(self.modified)
+        self.modified.clear()
+        return count
+
+    def install_chunk(self, cx, cz, data):
+        # Main thread only; a chunk that is already present (e.g. edited meanwhile) wins
+        chunk = self.chunks.get((cx, cz))
+        if chunk is not None:
+            return chunk
+        self.chunks[(cx, cz)] = data
+        self.generated.add((cx, cz))
+        self.version += 1
+        for obs in self.observers:
+            obs.chunk_loaded(cx, cz)
+        return data
+
+    def has_neighbourhood(self, cx, cz):
+        # Chunk and its four neighbours are loaded, so its border faces can be meshed for good
+        if self.sparse: return True  # every chunk can be derived
+        chunks = self.chunks
+        return ((cx, cz) in chunks and (cx+1, cz) in chunks and (cx-1, cz) in chunks
+                and (cx, cz+1) in chunks and (cx, cz-1) in chunks)
+
+    def _generate_chunk(self, cx, cz):
+        # Pure function of the seed: safe to run on a worker thread
+        # Chunk column layout: index = ((lx << CHUNK_SHIFT | lz) << HEIGHT_SHIFT) | y
+        data = bytearray(CHUNK_VOLUME)
+        x0, z0 = cx << CHUNK_SHIFT, cz << CHUNK_SHIFT
+        # Terrain layering for all columns at once: stone, 3 dirt, grass on top
+        top = np.frombuffer(self.heightmap(cx, cz), dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, 1).astype(np.int64)
+        y = np.arange(WORLD_HEIGHT)
+        blocks = np.frombuffer(data, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+        blocks[:] = np.where(y < top - 4, 3, np.where(y < top - 1, 2, np.where(y == top - 1, 1, 0)))
+        # Trees rooted up to 2 blocks outside the chunk can still drop leaves into it,
+        # so every chunk is generated the same way regardless of neighbour order
+        for x in range(x0 - 2, x0 + CHUNK_SIZE + 2):
+            for z in range(z0 - 2, z0 + CHUNK_SIZE + 2):
+                # Occasional tree on grass
+                rng_val = self.hash(x*13, z*17)
+                if rng_val <= 0.86: continue
+                top_y = self.height_at(x, z)
+                if top_y < 70:
+                    self._plant_tree(data, x0, z0, x, top_y, z)
+        return data
+
+    def _plant_tree(self, data, x0, z0, x, y, z):
         h = 4 + int(self.hash(x*7, z*9)*2)
         # trunk
-        for i in range(h):
-            self.blocks[(x, y+i, z)] = 4
+        lx, lz = x - x0, z - z0
+        if 0 <= lx < CHUNK_SIZE and 0 <= lz < CHUNK_SIZE:
+            base = (lx << CHUNK_SHIFT | lz) << HEIGHT_SHIFT
+            for i in range(h):
+                data[base + y + i] = 4
         # leaves cube
         r = 2
         for dx in range(-r, r+1):
-            for dy in range(-r, r+1):
-                for dz in range(-r, r+1):
+            if not 0 <= lx + dx < CHUNK_SIZE: continue
+            for dz in range(-r, r+1):
+                if not 0 <= lz + dz < CHUNK_SIZE: continue
+                base = ((lx + dx) << CHUNK_SHIFT | (lz + dz)) << HEIGHT_SHIFT
+                for dy in range(-r, r+1):
                     if abs(dx)+abs(dy)+abs(dz) > 4: continue
-                    self.blocks[(x+dx, y+h-1+dy, z+dz)] = 5
+                    data[base + y + h - 1 + dy] = 5
+
+    def occupancy(self, cx, cz):
+        # Solid blocks per BRICK_SIZE^3 brick of a chunk, one byte per brick laid out like the
+        # chunk itself: index = ((bx << BRICKS_SHIFT | bz) << BRICKS_HEIGHT_SHIFT) | by.
+        # 0 = empty brick, BRICK_VOLUME = full; EMPTY_OCCUPANCY = the whole chunk is air.
+        # Built on first use, then kept up to date by set_block; None if not generated
+        occ = self._occupancy.get((cx, cz))
+        if occ is None:
+            data = self.chunk_data(cx, cz)
+            if data is None: return None
+            n, h = CHUNK_SIZE >> BRICK_SHIFT, WORLD_HEIGHT >> BRICK_SHIFT
+            blocks = np.frombuffer(data, dtype=np.uint8).reshape(n, BRICK_SIZE, n, BRICK_SIZE, h, BRICK_SIZE)
+            occ = self._occupancy[(cx, cz)] = bytearray((blocks != 0).sum(axis=(1, 3, 5)).astype(np.uint8).tobytes())
+        return occ
+
+    def solid_top(self, cx, cz):
+        # Lowest y with only empty bricks above it anywhere in the chunk (0 if not generated)
+        top = self._solid_tops.get((cx, cz))
+        if top is None:
+            occ = self.occupancy(cx, cz)
+            if occ is None: return 0
+            column = 1 << BRICKS_HEIGHT_SHIFT
+            top = self._solid_tops[(cx, cz)] = max(len(occ[i:i + column].rstrip(b"\0")) for i in range(0, len(occ), column)) << BRICK_SHIFT
+        return top
+
+    def light(self, cx, cz):
+        # Light of every block of a chunk, laid out like the chunk: skylight in the high nibble,
+        # block light in the low one. Built on first use by chunk_light and stitched to the lit
+        # neighbours, then kept up to date by set_block; None if not generated
+        lit = self._light.get((cx, cz))
+        if lit is None:
+            data = self.chunk_data(cx, cz)
+            if data is None: return None
+            # Stitching may only restore what the chunks around had before (say this one was
+            # dropped from a sparse cache and comes back), so only light that differs is reported
+            around = [(cx + dx, cz + dz) for dx in (-1, 0, 1) for dz in (-1, 0, 1) if dx or dz]
+            before = {key: bytes(self._light[key]) for key in around if key in self._light}
+            lit = self._light[(cx, cz)] = chunk_light(data)
+            self._stitch_light(cx, cz)
+            self._light_changed(self._light_diff(before) | {(cx, cz)})
+        return lit
+
+    def light_column(self, x, z):
+        # Packed light of a whole column; missing terrain reads as open sky
+        lit = self.light(x >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+        if lit is None: return SKY_COLUMN
+        base = ((x & CHUNK_MASK) << CHUNK_SHIFT | (z & CHUNK_MASK)) << HEIGHT_SHIFT
+        return lit[base:base + WORLD_HEIGHT]
+
+    def _stitch_light(self, cx, cz):
+        # A chunk is first lit on its own; light that has to cross a border to or from a lit
+        # neighbour is spread from the border cells it leaves. Returns the chunks relit
+        here = np.frombuffer(self._light[(cx, cz)], dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+        x0, z0 = cx << CHUNK_SHIFT, cz << CHUNK_SHIFT
+        changed = set()
+        for shift in (4, 0):
+            queue = deque()
+            for dx, dz in NEIGHBOUR_OFFSETS[1:]:
+                lit = self._light.get((cx + dx, cz + dz))
+                if lit is None: continue
+                there = np.frombuffer(lit, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+                # Facing border slabs, indexed [position along the border, y]
+                edge = CHUNK_MASK if dx + dz > 0 else 0
+                a = (here[edge] if dx else here[:, edge]) >> shift & 0xF
+                b = (there[CHUNK_MASK - edge] if dx else there[:, CHUNK_MASK - edge]) >> shift & 0xF
+                for i, y in zip(*np.nonzero(a > b + 1)):
+                    queue.append((x0 + edge, int(y), z0 + int(i)) if dx else (x0 + int(i), int(y), z0 + edge))
+                for i, y in zip(*np.nonzero(b > a + 1)):
+                    queue.append((x0 + edge + dx, int(y), z0 + int(i)) if dx else (x0 + int(i), int(y), z0 + edge + dz))
+            if queue: self._spread_light(queue, shift, changed)
+        return changed
+
+    def _light_diff(self, before):
+        # Chunks whose light differs from before ((cx,cz) -> packed light), plus the neighbours
+        # across each border slab that changed, as faces take the light of the cell in front
+        relit = set()
+        for key, old in before.items():
+            new = self._light.get(key)
+            if new is None or new == old: continue
+            relit.add(key)
+            a = np.frombuffer(old, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+            b = np.frombuffer(new, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+            cx, cz = key
+            for nb, edge in (((cx-1, cz), np.s_[0]), ((cx+1, cz), np.s_[-1]), ((cx, cz-1), np.s_[:, 0]), ((cx, cz+1), np.s_[:, -1])):
+                if not np.array_equal(a[edge], b[edge]): relit.add(nb)
+        return relit
+
+    def _spread_light(self, queue, shift, changed):
+        # Addition pass of the light flood fill for one channel (shift 4 = sky, 0 = block): from
+        # each queued cell, raise the air around it to one level less (full skylight keeps going
+        # straight down) and queue the cells raised; chunks touched are added to changed
+        lights, chunks = self._light, self.chunks
+        while queue:
+            x, y, z = queue.popleft()
+            level = lights[(x >> CHUNK_SHIFT, z >> CHUNK_SHIFT)][((x & CHUNK_MASK) << CHUNK_SHIFT | (z & CHUNK_MASK)) << HEIGHT_SHIFT | y] >> shift & 0xF
+            if level <= 1: continue
+            for dx, dy, dz in FACE_DIRS:
+                ny = y + dy
+                if not 0 <= ny < WORLD_HEIGHT: continue
+                nx, nz = x + dx, z + dz
+                key = (nx >> CHUNK_SHIFT, nz >> CHUNK_SHIFT)
+                lit = lights.get(key)
+                if lit is None: continue
+                index = ((nx & CHUNK_MASK) << CHUNK_SHIFT | (nz & CHUNK_MASK)) << HEIGHT_SHIFT | ny
+                if chunks[key][index] != 0: continue
+                target = level if shift == 4 and dy < 0 and level == MAX_LIGHT else level - 1
+                if lit[index] >> shift & 0xF >= target: continue
+                lit[index] = lit[index] & ~(0xF << shift) & 0xFF | target << shift
+                self._mark_lit(changed, nx, nz)
+                queue.append((nx, ny, nz))
+
+    def _relight(self, x, y, z, bid):
+        # Incremental light update after the block at (x,y,z) became bid, per channel: a removal
+        # pass darkens the cells lit through or from this one, queueing the brighter cells it
+        # runs into, then the addition pass refills from those and from the block's own light
+        lights, chunks = self._light, self.chunks
+        index = ((x & CHUNK_MASK) << CHUNK_SHIFT | (z & CHUNK_MASK)) << HEIGHT_SHIFT | y
+        lit = lights[(x >> CHUNK_SHIFT, z >> CHUNK_SHIFT)]
+        changed = set()
+        self._mark_lit(changed, x, z)
+        for shift in (4, 0):
+            remove, add = deque([(x, y, z, lit[index] >> shift & 0xF)]), deque()
+            lit[index] &= ~(0xF << shift) & 0xFF
+            while remove:
+                px, py, pz, plevel = remove.popleft()
+                for dx, dy, dz in FACE_DIRS:
+                    ny = py + dy
+                    if not 0 <= ny < WORLD_HEIGHT: continue
+                    nx, nz = px + dx, pz + dz
+                    key = (nx >> CHUNK_SHIFT, nz >> CHUNK_SHIFT)
+                    nlit = lights.get(key)
+                    if nlit is None: continue
+                    ni = ((nx & CHUNK_MASK) << CHUNK_SHIFT | (nz & CHUNK_MASK)) << HEIGHT_SHIFT | ny
+                    nlevel = nlit[ni] >> shift & 0xF
+                    if nlevel == 0: continue
+                    if (nlevel < plevel or shift == 4 and dy < 0 and plevel == MAX_LIGHT) and not (shift == 0 and chunks[key][ni] in BLOCK_LIGHT):
+                        nlit[ni] &= ~(0xF << shift) & 0xFF
+                        self._mark_lit(changed, nx, nz)
+                        remove.append((nx, ny, nz, nlevel))
+                    else:
+                        add.append((nx, ny, nz))  # lit from elsewhere: spreads back into the gap
+            source = BLOCK_LIGHT.get(bid, 0) if shift == 0 else MAX_LIGHT if bid == 0 and y == WORLD_HEIGHT - 1 else 0
+            if source:
+                lit[index] |= source << shift
+                add.append((x, y, z))
+            self._spread_light(add, shift, changed)
+        self._light_changed(changed)
+
+    def _mark_lit(self, changed, x, z):
+        # Faces take the light of the air in front of them, so a border cell also relights the neighbour
+        cx, cz = x >> CHUNK_SHIFT, z >> CHUNK_SHIFT
+        changed.add((cx, cz))
+        lx, lz = x & CHUNK_MASK, z & CHUNK_MASK
+        if lx == 0: changed.add((cx-1, cz))
+        elif lx == CHUNK_MASK: changed.add((cx+1, cz))
+        if lz == 0: changed.add((cx, cz-1))
+        elif lz == CHUNK_MASK: changed.add((cx, cz+1))
+
+    def _light_changed(self, changed):
+        for cx, cz in changed:
+            for obs in self.observers:
+                obs.light_changed(cx, cz)
 
     def get_block(self, x, y, z):
-        return self.blocks.get((x, y, z), 0)
+        if y < 0 or y >= WORLD_HEIGHT: return 0
+        key = (x >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if self.sparse:
+            if chunk is None: chunk = self._materialise(*key)
+            else: self.chunks.move_to_end(key)
+        elif chunk is None: return 0
+        return chunk[((x & CHUNK_MASK) << CHUNK_SHIFT | (z & CHUNK_MASK)) << HEIGHT_SHIFT | y]
 
     def set_block(self, x, y, z, bid):
-        if bid == 0:
-            self.blocks.pop((x, y, z), None)
+        if y < 0 or y >= WORLD_HEIGHT: return
+        # Writing into ungenerated terrain generates it first so the edit is never overwritten
+        key = (x >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+        index = ((x & CHUNK_MASK) << CHUNK_SHIFT | (z & CHUNK_MASK)) << HEIGHT_SHIFT | y
+        chunk = self.ensure_chunk(*key)
+        # Light the chunk first if its neighbours are, so the update below sees consistent light
+        if any((key[0] + dx, key[1] + dz) in self._light for dx, dz in NEIGHBOUR_OFFSETS):
+            self.light(*key)
+        old = chunk[index]
+        chunk[index] = bid
+        occ = self._occupancy.get(key)
+        if occ is not None and (old != 0) != (bid != 0):
+            brick = ((x & CHUNK_MASK) >> BRICK_SHIFT << BRICKS_SHIFT | (z & CHUNK_MASK) >> BRICK_SHIFT) << BRICKS_HEIGHT_SHIFT | y >> BRICK_SHIFT
+            occ[brick] += 1 if bid else -1
+            self._solid_tops.pop(key, None)
+        if self.sparse:
+            self._record_edits(key, chunk, (index,), (bid,))
+        self.modified.add(key)
+        self.version += 1
+        if key in self._light and old != bid:
+            self._relight(x, y, z, bid)
+        for obs in self.observers:
+            obs.block_changed(x, y, z)
+
+    # Bulk edits, like the /fill and /clone commands: a box is two opposite corners (x,y,z),
+    # both inclusive, in any order. Whole chunk slices are written at once and caches are
+    # refreshed once per chunk; each returns the number of blocks changed
+    def fill(self, box, bid):
+        return self._write_box(box, lambda old, origin: bid)
+
+    def replace(self, box, from_id, to_id):
+        return self._write_box(box, lambda old, origin: np.where(old == from_id, to_id, old))
+
+    def clone(self, box, dst):
+        # Copies box so that its lowest corner lands on dst; the source is read in full first,
+        # so overlapping boxes copy like the command does
+        lo, hi = self._box_bounds(box)
+        src = self._read_box(lo, hi)
+        def values(old, origin):
+            x, y, z = (origin[a] - dst[a] for a in range(3))
+            return src[x:x + old.shape[0], z:z + old.shape[1], y:y + old.shape[2]]
+        return self._write_box((dst, tuple(dst[a] + hi[a] - lo[a] - 1 for a in range(3))), values)
+
+    def _box_bounds(self, box):
+        # Lowest corner and one past the highest corner of a box
+        a, b = box
+        return tuple(min(a[i], b[i]) for i in range(3)), tuple(max(a[i], b[i]) + 1 for i in range(3))
+
+    def _read_box(self, lo, hi):
+        # Block ids of the box lo..hi (exclusive) as an array indexed [x, z, y]; outside the
+        # world reads as air. Ungenerated terrain is generated first, as _write_box does, so a
+        # dense world reads what a sparse one derives
+        out = np.zeros((hi[0] - lo[0], hi[2] - lo[2], hi[1] - lo[1]), dtype=np.uint8)
+        y0, y1 = max(lo[1], 0), min(hi[1], WORLD_HEIGHT)
+        if y0 >= y1: return out
+        for cx in range(lo[0] >> CHUNK_SHIFT, ((hi[0] - 1) >> CHUNK_SHIFT) + 1):
+            for cz in range(lo[2] >> CHUNK_SHIFT, ((hi[2] - 1) >> CHUNK_SHIFT) + 1):
+                data = self.ensure_chunk(cx, cz)
+                x0, z0 = cx << CHUNK_SHIFT, cz << CHUNK_SHIFT
+                ax, bx = max(lo[0], x0), min(hi[0], x0 + CHUNK_SIZE)
+                az, bz = max(lo[2], z0), min(hi[2], z0 + CHUNK_SIZE)
+                blocks = np.frombuffer(data, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+                out[ax - lo[0]:bx - lo[0], az - lo[2]:bz - lo[2], y0 - lo[1]:y1 - lo[1]] = blocks[ax - x0:bx - x0, az - z0:bz - z0, y0:y1]
+        return out
+
+    def _write_box(self, box, values):
+        # Behind fill/replace/clone: for each chunk slice of the box (indexed [x, z, y]),
+        # values(old ids, (x,y,z) of its lowest corner) gives the new ids. Writing into
+        # ungenerated terrain generates it first, as set_block does
+        lo, hi = self._box_bounds(box)
+        y0, y1 = max(lo[1], 0), min(hi[1], WORLD_HEIGHT)
+        if y0 >= y1: return 0
+        count, edited, borders = 0, set(), set()
+        for cx in range(lo[0] >> CHUNK_SHIFT, ((hi[0] - 1) >> CHUNK_SHIFT) + 1):
+            for cz in range(lo[2] >> CHUNK_SHIFT, ((hi[2] - 1) >> CHUNK_SHIFT) + 1):
+                x0, z0 = cx << CHUNK_SHIFT, cz << CHUNK_SHIFT
+                lx0, lx1 = max(lo[0] - x0, 0), min(hi[0] - x0, CHUNK_SIZE)
+                lz0, lz1 = max(lo[2] - z0, 0), min(hi[2] - z0, CHUNK_SIZE)
+                chunk = self.ensure_chunk(cx, cz)
+                blocks = np.frombuffer(chunk, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+                old = blocks[lx0:lx1, lz0:lz1, y0:y1]
+                new = np.broadcast_to(values(old, (x0 + lx0, y0, z0 + lz0)), old.shape).astype(np.uint8)
+                changed = new != old
+                if not changed.any(): continue
+                key = (cx, cz)
+                count += int(changed.sum())
+                old[...] = new
+                if self.sparse:
+                    ix, iz, iy = np.nonzero(changed)
+                    index = ((ix + lx0) << CHUNK_SHIFT | (iz + lz0)) << HEIGHT_SHIFT | (iy + y0)
+                    self._record_edits(key, chunk, index, old[changed])
+                edited.add(key)
+                # Border blocks also expose or hide faces of the neighbour chunk
+                if lx0 == 0 and changed[0].any(): borders.add((cx-1, cz))
+                if lx1 == CHUNK_SIZE and changed[-1].any(): borders.add((cx+1, cz))
+                if lz0 == 0 and changed[:, 0].any(): borders.add((cx, cz-1))
+                if lz1 == CHUNK_SIZE and changed[:, -1].any(): borders.add((cx, cz+1))
+        if not edited: return 0
+        self.version += 1
+        for key in edited:
+            self._occupancy.pop(key, None)
+            self._solid_tops.pop(key, None)
+            self.modified.add(key)
+        # Light reaches at most one chunk further, so relighting the edited chunks and the lit
+        # chunks around them from scratch is exact; meshes are told only where light changed
+        relight = {(cx + dx, cz + dz) for cx, cz in edited for dx in (-1, 0, 1) for dz in (-1, 0, 1)}
+        old_light = {key: self._light.pop(key) for key in relight if key in self._light}
+        relit = set()
+        for key in old_light:
+            data = self.chunk_data(*key)
+            if data is not None:
+                self._light[key] = chunk_light(data)
+        for key in old_light:
+            if key in self._light:
+                relit |= self._stitch_light(*key)
+        relit |= self._light_diff(old_light)
+        changed = edited | borders
+        for obs in self.observers:
+            for cx, cz in changed:
+                obs.chunk_changed(cx, cz)
+            for cx, cz in relit - changed:
+                obs.light_changed(cx, cz)
+        return count
+
+    def surface(self, cx, cz):
+        # Height (index of the first air above) and block id of the top block of every column,
+        # as (CHUNK_SIZE, CHUNK_SIZE) arrays. Terrain not in memory comes from the heightmap
+        # alone, so distant chunks cost no generation
+        if self.sparse:
+            chunk = self.chunk_data(cx, cz) if (cx, cz) in self.edits else None
         else:
-            self.blocks[(x, y, z)] = bid
+            chunk = self.chunks.get((cx, cz))
+        if chunk is None:
+            h = np.frombuffer(self.heightmap(cx, cz), dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE).astype(np.int64)
+            return h, np.ones_like(h)  # bare terrain is capped with grass
+        blocks = np.frombuffer(chunk, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+        solid = blocks != 0
+        h = np.where(solid.any(axis=2), WORLD_HEIGHT - np.argmax(solid[..., ::-1], axis=2), 0)
+        ids = np.take_along_axis(blocks, np.maximum(h - 1, 0)[..., None], axis=2)[..., 0]
+        return h, ids.astype(np.int64)
+
+    def column(self, x, z):
+        # Whole WORLD_HEIGHT column of block ids; missing terrain reads as air
+        chunk = self.chunk_data(x >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+        if chunk is None: return EMPTY_COLUMN
+        base = ((x & CHUNK_MASK) << CHUNK_SHIFT | (z & CHUNK_MASK)) << HEIGHT_SHIFT
+        return chunk[base:base + WORLD_HEIGHT]
+
+    def region_chunks(self, x, z, radius):
+        # Chunk coordinates overlapping the square of blocks within radius of (x,z);
+        # rebuilt only when the covered chunk range changes
+        bounds = ((x - radius) >> CHUNK_SHIFT, (x + radius) >> CHUNK_SHIFT,
+                  (z - radius) >> CHUNK_SHIFT, (z + radius) >> CHUNK_SHIFT)
+        if bounds != self._region_bounds:
+            self._region_bounds = bounds
+            self._region = frozenset((a, b) for a in range(bounds[0], bounds[1]+1)
+                                            for b in range(bounds[2], bounds[3]+1))
+        return self._region
 
     def populate_region(self, cx, cz, radius):
-        # Generate columns within radius around (cx,cz)
-        for dx in range(-radius, radius+1):
-            for dz in range(-radius, radius+1):
-                if abs(dx) + abs(dz) > radius: continue
-                self.ensure_column(cx+dx, cz+dz)
+        # Generate chunks within radius around (cx,cz); a set difference against the
+        # registry, so terrain that is already known costs nothing
+        if self.sparse: return  # terrain is derived on demand
+        for key in sorted(self.region_chunks(cx, cz, radius) - self.generated):
+            self.ensure_chunk(*key)
+
+def chunk_light(data):
+    # Packed light of a chunk on its own (see World.light): skylight down each column to its
+    # top block and block light at emitting blocks, both spread through air until stable
+    blocks = np.frombuffer(data, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+    air = blocks == 0
+    solid = ~air
+    top = np.where(solid.any(axis=2), WORLD_HEIGHT - np.argmax(solid[..., ::-1], axis=2), 0)
+    emit = np.zeros(256, dtype=np.int16)
+    emit[list(BLOCK_LIGHT)] = list(BLOCK_LIGHT.values())
+    channels = []
+    for source in (np.where(np.arange(WORLD_HEIGHT) >= top[..., None], MAX_LIGHT, 0).astype(np.int16), emit[blocks]):
+        light = source
+        while light.any():
+            spread = light.copy()
+            for a in range(3):
+                src, dst = np.moveaxis(light, a, 0), np.moveaxis(spread, a, 0)
+                np.maximum(dst[1:], src[:-1] - 1, out=dst[1:])
+                np.maximum(dst[:-1], src[1:] - 1, out=dst[:-1])
+            spread = np.where(air, spread, source)
+            if np.array_equal(spread, light): break
+            light = spread
+        channels.append(light)
+    return bytearray((channels[0] << 4 | channels[1]).astype(np.uint8).tobytes())
+
+# ---------- Region files ----------
+class RegionStore:
+    # Edited chunks on disk, one file per REGION_SIZE x REGION_SIZE chunks:
+    #   header   MAGIC, chunk volume (uint32), reserved (uint32)
+    #   table    REGION_SIZE**2 uint32 slot numbers (0 = chunk not saved)
+    #   slots    fixed-size raw chunk arrays, slot n at DATA_OFFSET + (n-1)*CHUNK_VOLUME
+    # Files are memory-mapped when first needed, so loading a chunk is one slice of the map
+    # and opening a world costs nothing until the camera comes near its edits
+    MAGIC = b"TCMREGN1"
+    HEADER = struct.Struct("<8sII")
+    TABLE = struct.Struct("<%dI" % (REGION_SIZE * REGION_SIZE))
+    DATA_OFFSET = HEADER.size + TABLE.size
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._regions = {}  # (rx,rz) -> (mmap, table) or None when there is no file
+        self._lock = threading.Lock()  # chunks are read from generator threads
+
+    def _path(self, rx, rz):
+        return os.path.join(self.directory, f"r.{rx}.{rz}.tcr")
+
+    def _region(self, rx, rz):
+        # Caller holds the lock
+        key = (rx, rz)
+        if key not in self._regions:
+            path = self._path(rx, rz)
+            region = None
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, volume, _ = self.HEADER.unpack_from(mm, 0)
+                if magic != self.MAGIC or volume != CHUNK_VOLUME:
+                    mm.close()
+                    raise ValueError(f"{path} is not a region file for this chunk size")
+                region = (mm, list(self.TABLE.unpack_from(mm, self.HEADER.size)))
+            self._regions[key] = region
+        return self._regions[key]
+
+    @staticmethod
+    def _slot_index(cx, cz):
+        return (cx & (REGION_SIZE - 1)) << REGION_SHIFT | (cz & (REGION_SIZE - 1))
+
+    def read(self, cx, cz):
+        with self._lock:
+            region = self._region(cx >> REGION_SHIFT, cz >> REGION_SHIFT)
+            if region is None: return None
+            mm, table = region
+            slot = table[self._slot_index(cx, cz)]
+            if slot == 0: return None
+            start = self.DATA_OFFSET + (slot - 1) * CHUNK_VOLUME
+            return bytearray(mm[start:start + CHUNK_VOLUME])
+
+    def write(self, cx, cz, data):
+        rx, rz = cx >> REGION_SHIFT, cz >> REGION_SHIFT
+        with self._lock:
+            region = self._region(rx, rz)
+            table = region[1] if region else [0] * (REGION_SIZE * REGION_SIZE)
+            index = self._slot_index(cx, cz)
+            new_file = region is None
+            # Drop the read-only map (or the note that there is no file); it is rebuilt from the
+            # file on the next read or write
+            if region is not None:
+                region[0].close()
+            del self._regions[(rx, rz)]
+            with open(self._path(rx, rz), "w+b" if new_file else "r+b") as f:
+                if new_file:
+                    f.write(self.HEADER.pack(self.MAGIC, CHUNK_VOLUME, 0))
+                    f.write(self.TABLE.pack(*table))
+                if table[index] == 0:
+                    table[index] = max(table) + 1
+                    f.seek(self.HEADER.size + 4 * index)
+                    f.write(struct.pack("<I", table[index]))
+                f.seek(self.DATA_OFFSET + (table[index] - 1) * CHUNK_VOLUME)
+                f.write(data)
+
+    def close(self):
+        with self._lock:
+            for region in self._regions.values():
+                if region is not None:
+                    region[0].close()
+            self._regions.clear()
+
+def open_world(directory, sparse=SPARSE_WORLD):
+    # World backed by a save directory; the seed lives in level.json next to the region files
+    os.makedirs(directory, exist_ok=True)
+    level_path = os.path.join(directory, "level.json")
+    if os.path.exists(level_path):
+        with open(level_path) as f:
+            seed = json.load(f)["seed"]
+    else:
+        seed = WORLD_SEED
+        with open(level_path, "w") as f:
+            json.dump({"seed": seed}, f)
+    world = World(seed, sparse)
+    world.store = RegionStore(directory)
+    return world
+
+# ---------- Background chunk generation ----------
+class ChunkGenerator:
+    # Generates missing chunks on a thread pool, nearest and most-ahead first. Finished
+    # chunks are installed on the main thread, so World is only ever mutated there
+    def __init__(self, world, workers=GEN_WORKERS):
+        self.world = world
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunkgen")
+        self.pending = {}  # (cx,cz) -> Future
+        # Keep the queue short so priorities follow the camera instead of a stale backlog
+        self.max_pending = workers * 2
+        self.last_pos = None
+
+    def update(self, cam, radius):
+        self.install_finished()
+        # Heading: movement since last frame, or the view direction when standing still
+        hx, hz = 0.0, 0.0
+        if self.last_pos is not None:
+            hx, hz = cam.x - self.last_pos[0], cam.z - self.last_pos[1]
+        if hx*hx + hz*hz < 1e-6:
+            fx, _, fz = cam.dir_forward()
+            hx, hz = fx, fz
+        hl = math.hypot(hx, hz) or 1.0
+        hx, hz = hx/hl, hz/hl
+        self.last_pos = (cam.x, cam.z)
+
+        free = self.max_pending - len(self.pending)
+        if free <= 0: return
+        pending = self.pending
+        missing = []
+        for ccx, ccz in self.world.region_chunks(int(round(cam.x)), int(round(cam.z)), radius) - self.world.generated:
+            if (ccx, ccz) in pending: continue
+            dx = (ccx + 0.5) * CHUNK_SIZE - cam.x
+            dz = (ccz + 0.5) * CHUNK_SIZE - cam.z
+            dist = math.hypot(dx, dz)
+            ahead = (dx*hx + dz*hz) / dist if dist > 0 else 1.0
+            # Chunks ahead of the camera count as up to 2x closer than those behind it
+            missing.append((dist * (1.5 - 0.5*ahead), ccx, ccz))
+        missing.sort()
+        for _, ccx, ccz in missing[:free]:
+            pending[(ccx, ccz)] = self.pool.submit(self.world.load_chunk, ccx, ccz)
+
+    def install_finished(self, budget=GEN_INSTALL_PER_FRAME):
+        done = [key for key, fut in self.pending.items() if fut.done()]
+        for key in done[:budget]:
+            data = self.pending.pop(key).result()
+            self.world.install_chunk(key[0], key[1], data)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
 
 # ---------- Rendering ----------
 # Cube vertices relative to (x,y,z)
@@ -225,136 +998,1227 @@ def shade_color(base_rgb, normal):
     b = int(clamp(base_rgb[2]*k, 0, 255))
     return (r,g,b)
 
-def render_world(screen, cam, world, cx, cz):
-    # Gather faces to draw
-    faces_to_draw = []
-    minx, maxx = int(cam.x - RENDER_RADIUS), int(cam.x + RENDER_RADIUS)
-    miny, maxy = -2, 96
-    minz, maxz = int(cam.z - RENDER_RADIUS), int(cam.z + RENDER_RADIUS)
-
-    # Ensure terrain generated around camera
-    world.populate_region(int(round(cam.x)), int(round(cam.z)), RENDER_RADIUS)
-
-    for x in range(minx, maxx+1):
-        for z in range(minz, maxz+1):
-            # Cheap skip: if column empty assume generated lazily by populate_region
-            # We still iterate to skip drawing empty columns quickly
-            # Determine approximate surface to limit y scanning
-            top_y = world.height_at(x, z)
-            y_lo = max(miny, top_y - 20)
-            y_hi = min(maxy, top_y + 8)
-            for y in range(y_lo, y_hi):
-                bid = world.get_block(x, y, z)
+# Shaded colour per (block id, normal), computed once
+SHADED = {(bid, nrm): shade_color(col, nrm) for bid, col in BLOCK_COLORS.items() for _, nrm in FACES}
+
+def light_color(rgb, packed):
+    # Colour scaled by the brighter channel of a packed light byte (see World.light), rounded up
+    # to the top of its LIGHT_STEP band
+    dark = (MAX_LIGHT - max(packed >> 4, packed & 0xF)) // LIGHT_STEP * LIGHT_STEP
+    k = max(LIGHT_FLOOR, LIGHT_FALLOFF ** dark)
+    return (int(rgb[0]*k), int(rgb[1]*k), int(rgb[2]*k))
+
+# Lit colours: SHADED_LIGHT[bid][face index][packed light]; emitting blocks are always fully lit
+SHADED_LIGHT = {bid: [[SHADED[(bid, nrm)] if bid in BLOCK_LIGHT else light_color(SHADED[(bid, nrm)], b) for b in range(256)]
+                      for _, nrm in FACES] for bid in BLOCK_COLORS}
+UNKNOWN_LIGHT = [[light_color((200,200,200), b) for b in range(256)]] * 6
+
+# ---------- Chunk meshes ----------
+FACE_WORDS = 18  # packed face: 4 corners x 3, normal, colour (see pack_faces)
+# World-space corner offsets of each face, in FACES order
+FACE_CORNERS = [[CUBE_VERTS[vid] for vid in idxs] for idxs, _ in FACES]
+# Axis each face is perpendicular to, and the two in-plane (u, v) axes
+FACE_AXIS = [0 if n[0] else 1 if n[1] else 2 for _, n in FACES]
+FACE_UV = [tuple(k for k in range(3) if k != a) for a in FACE_AXIS]
+
+def build_chunk_mesh(world, cx, cz):
+    # Visible faces of one chunk as (corners, normal, colour); a face is visible when its neighbour
+    # is air, and lit by that neighbour's light
+    data = world.chunk_data(cx, cz)
+    if data is None or world.occupancy(cx, cz) == EMPTY_OCCUPANCY: return []
+    rows = mesh_rows(world, cx, cz)
+    # Light the chunk and its neighbours up front: lighting one can relight the others
+    for dx, dz in NEIGHBOUR_OFFSETS:
+        world.light(cx + dx, cz + dz)
+    lit = world.light(cx, cz)
+    # Visible unit faces bucketed by plane and section: (face index, plane, section) -> {(u, v): colour};
+    # merged quads never span two sections, so cave culling can drop them section by section
+    slices = {}
+    x0, z0 = cx << CHUNK_SHIFT, cz << CHUNK_SHIFT
+    for lx in range(CHUNK_SIZE):
+        x = x0 + lx
+        for lz in range(CHUNK_SIZE):
+            z = z0 + lz
+            base = (lx << CHUNK_SHIFT | lz) << HEIGHT_SHIFT
+            col = data[base:base + WORLD_HEIGHT]
+            top = len(col.rstrip(b"\0"))
+            if top == 0: continue
+            # Neighbouring columns and their light; across the chunk border they come from the neighbour chunk
+            col_px, col_nx = world.column(x+1, z), world.column(x-1, z)
+            col_pz, col_nz = world.column(x, z+1), world.column(x, z-1)
+            light = lit[base:base + WORLD_HEIGHT]
+            light_px, light_nx = world.light_column(x+1, z), world.light_column(x-1, z)
+            light_pz, light_nz = world.light_column(x, z+1), world.light_column(x, z-1)
+            for y in rows[lx >> BRICK_SHIFT][lz >> BRICK_SHIFT]:
+                if y >= top: break
+                bid = col[y]
                 if bid == 0: continue
-                base_col = BLOCK_COLORS.get(bid, (200,200,200))
-
-                # For each face, if neighbor is air, draw
-                for idxs, nrm in FACES:
-                    nx, ny, nz = nrm
-                    if world.get_block(x+nx, y+ny, z+nz) != 0:
-                        continue  # occluded
-                    # Transform vertices
-                    pts_cam = []
-                    zsum = 0.0
-                    skip = False
-                    for vid in idxs:
-                        vx, vy, vz = CUBE_VERTS[vid]
-                        wx, wy, wz = x+vx, y+vy, z+vz
-                        cxp, cyp, czp = cam.rotate_point(wx, wy, wz)
-                        if czp <= NEAR_PLANE:
-                            skip = True
-                            break
-                        zsum += czp
-                        proj = cam.project(cxp, cyp, czp)
-                        if proj is None:
-                            skip = True
-                            break
-                        pts_cam.append(proj)
-                    if skip or len(pts_cam) != 4:
-                        continue
-                    # Back-face culling in camera space:
-                    # Two triangles; compute signed area to infer winding
-                    ax, ay = pts_cam[0]
-                    bx, by = pts_cam[1]
-                    cxp2, cyp2 = pts_cam[2]
-                    area = (bx-ax)*(cyp2-ay) - (by-ay)*(cxp2-ax)
-                    if area >= 0:  # screen-space backface (assuming right-handed)
-                        pass  # Allow; since we skipped occluded faces already
-
-                    depth = zsum / 4.0
-                    col = shade_color(base_col, nrm)
-                    faces_to_draw.append((depth, pts_cam, col))
-
-    # Depth sort far to near
-    faces_to_draw.sort(key=lambda f: -f[0])
+                neighbours = (
+                    col_px[y], col_nx[y],
+                    col[y+1] if y+1 < WORLD_HEIGHT else 0,
+                    col[y-1] if y > 0 else bid,  # never draw the underside of the world
+                    col_pz[y], col_nz[y],
+                )
+                lights = (
+                    light_px[y], light_nx[y],
+                    light[y+1] if y+1 < WORLD_HEIGHT else MAX_LIGHT << 4,
+                    light[y-1] if y > 0 else 0,
+                    light_pz[y], light_nz[y],
+                )
+                shades = SHADED_LIGHT.get(bid, UNKNOWN_LIGHT)
+                pos = (x, y, z)
+                for fi in range(6):
+                    if neighbours[fi] != 0: continue  # occluded
+                    a = FACE_AXIS[fi]
+                    plane = pos[a] + (FACES[fi][1][a] > 0)
+                    ua, va = FACE_UV[fi]
+                    cells = slices.get((fi, plane, y >> SECTION_SHIFT))
+                    if cells is None:
+                        cells = slices[(fi, plane, y >> SECTION_SHIFT)] = {}
+                    cells[(pos[ua], pos[va])] = shades[fi][lights[fi]]
+    faces = []
+    for (fi, plane, _), cells in slices.items():
+        nrm = FACES[fi][1]
+        for rect in greedy_rects(cells):
+            faces.append((quad_corners(fi, plane, rect), nrm, rect[4]))
+    return faces
+
+def mesh_rows(world, cx, cz):
+    # For each brick column [bx][bz] of a chunk, the y values build_chunk_mesh has to look at:
+    # empty bricks and full bricks whose six neighbouring bricks are full too have no faces
+    n, h = CHUNK_SIZE >> BRICK_SHIFT, WORLD_HEIGHT >> BRICK_SHIFT
+    occ = np.frombuffer(world.occupancy(cx, cz), dtype=np.uint8).reshape(n, n, h)
+    # Full bricks padded with the neighbouring chunks' border bricks; below the world counts
+    # as full (the underside is never drawn), above it and missing terrain as not full
+    full = np.zeros((n+2, n+2, h+2), dtype=bool)
+    full[1:-1, 1:-1, 1:-1] = occ == BRICK_VOLUME
+    full[1:-1, 1:-1, 0] = True
+    for (dx, dz), dst, src in (((-1, 0), (0, slice(1, -1)), -1), ((1, 0), (-1, slice(1, -1)), 0),
+                               ((0, -1), (slice(1, -1), 0), -1), ((0, 1), (slice(1, -1), -1), 0)):
+        nb = world.occupancy(cx + dx, cz + dz)
+        if nb is None: continue
+        nb = np.frombuffer(nb, dtype=np.uint8).reshape(n, n, h)
+        full[dst + (slice(1, -1),)] = (nb[src] if dx else nb[:, src]) == BRICK_VOLUME
+    inner = full[1:-1, 1:-1, 1:-1]
+    buried = (inner & full[2:, 1:-1, 1:-1] & full[:-2, 1:-1, 1:-1] & full[1:-1, 2:, 1:-1]
+              & full[1:-1, :-2, 1:-1] & full[1:-1, 1:-1, 2:] & full[1:-1, 1:-1, :-2])
+    keep = (occ > 0) & ~buried
+    return [[[y for by in np.flatnonzero(keep[bx, bz]).tolist() for y in range(by << BRICK_SHIFT, (by + 1) << BRICK_SHIFT)]
+             for bz in range(n)] for bx in range(n)]
+
+def pack_faces(faces):
+    # (corners, normal, colour) faces as rows of FACE_WORDS int32s: 4 corners, normal, colour
+    return np.array([[c for corner in f[0] for c in corner] + list(f[1]) + list(f[2]) for f in faces],
+                    dtype=np.int32).reshape(-1, FACE_WORDS)
+
+def greedy_rects(cells):
+    # Merge a plane of unit cells {(u, v): colour} into maximal same-colour rectangles
+    # (u0, v0, u1, v1, colour); consumes cells
+    rects = []
+    for u, v in sorted(cells):
+        col = cells.get((u, v))
+        if col is None: continue  # already merged
+        v1 = v + 1
+        while cells.get((u, v1)) == col:
+            v1 += 1
+        u1 = u + 1
+        while all(cells.get((u1, k)) == col for k in range(v, v1)):
+            u1 += 1
+        for i in range(u, u1):
+            for k in range(v, v1):
+                del cells[(i, k)]
+        rects.append((u, v, u1, v1, col))
+    return rects
+
+def quad_corners(fi, plane, rect):
+    # Stretch the unit face corners of FACES[fi] over the rectangle, keeping its winding
+    u0, v0, u1, v1 = rect[:4]
+    a = FACE_AXIS[fi]
+    ua, va = FACE_UV[fi]
+    corners = []
+    for c in FACE_CORNERS[fi]:
+        p = [0, 0, 0]
+        p[a] = plane
+        p[ua] = u1 if c[ua] else u0
+        p[va] = v1 if c[va] else v0
+        corners.append(tuple(p))
+    return corners
+
+def lod_cells(world, cx, cz, step):
+    # Tallest column of every step x step cell of a chunk: (n, n) heights and top block ids
+    h, ids = world.surface(cx, cz)
+    n = CHUNK_SIZE // step
+    h = h.reshape(n, step, n, step).transpose(0, 2, 1, 3).reshape(n, n, step*step)
+    ids = ids.reshape(n, step, n, step).transpose(0, 2, 1, 3).reshape(n, n, step*step)
+    pick = h.argmax(axis=2)[..., None]
+    return np.take_along_axis(h, pick, 2)[..., 0], np.take_along_axis(ids, pick, 2)[..., 0]
+
+def build_lod_mesh(world, cx, cz, step):
+    # Coarse stand-in for a distant chunk, as (corners, normal, colour) like build_chunk_mesh.
+    # Each step x step cell of columns becomes a box as tall as its tallest column: a top face
+    # plus side faces where the neighbouring cell is lower. Side faces on the chunk border reach
+    # step blocks further down (a skirt) to hide cracks against chunks at another level of detail
+    n = CHUNK_SIZE // step
+    tops, ids = lod_cells(world, cx, cz, step)
+    # Cell heights padded with the facing edge cells of the four neighbouring chunks
+    pad = np.zeros((n+2, n+2), dtype=np.int64)
+    pad[1:-1, 1:-1] = tops
+    pad[0, 1:-1] = lod_cells(world, cx-1, cz, step)[0][-1]
+    pad[-1, 1:-1] = lod_cells(world, cx+1, cz, step)[0][0]
+    pad[1:-1, 0] = lod_cells(world, cx, cz-1, step)[0][:, -1]
+    pad[1:-1, -1] = lod_cells(world, cx, cz+1, step)[0][:, 0]
+    origin = (cx << CHUNK_SHIFT, 0, cz << CHUNK_SHIFT)
+    # Same plane buckets as build_chunk_mesh, in cell units along X and Z and blocks along Y
+    slices = {}
+    for i in range(n):
+        for j in range(n):
+            t, bid = int(tops[i, j]), int(ids[i, j])
+            if t == 0: continue
+            up = FACES[2][1]
+            slices.setdefault((2, t), {})[(i, j)] = SHADED.get((bid, up), (200,200,200))
+            for fi in (0, 1, 4, 5):
+                nrm = FACES[fi][1]
+                ni, nj = i + nrm[0], j + nrm[2]
+                tn = int(pad[ni+1, nj+1])
+                low = max(0, min(tn, t) - step) if not (0 <= ni < n and 0 <= nj < n) else tn
+                if low >= t: continue
+                a = FACE_AXIS[fi]
+                plane = origin[a] + ((i if a == 0 else j) + (nrm[a] > 0)) * step
+                cells = slices.setdefault((fi, plane), {})
+                # One colour per side keeps the quad count down; detail is lost at this distance anyway
+                col = SHADED.get((bid, nrm), (200,200,200))
+                for y in range(low, t):
+                    cells[(y, j) if a == 0 else (i, y)] = col
+    faces = []
+    for (fi, plane), cells in slices.items():
+        ua, va = FACE_UV[fi]
+        su, sv = (1 if ua == 1 else step), (1 if va == 1 else step)
+        for u0, v0, u1, v1, col in greedy_rects(cells):
+            rect = (origin[ua] + u0*su, origin[va] + v0*sv, origin[ua] + u1*su, origin[va] + v1*sv)
+            faces.append((quad_corners(fi, plane, rect), FACES[fi][1], col))
+    return faces
+
+OPPOSITE_FACE = [1, 0, 3, 2, 5, 4]
+NEIGHBOUR_OFFSETS = ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1))
+
+def section_connectivity(data):
+    # Visibility graph of each section of a chunk: for every section and face f (FACES order),
+    # a bitmask of the faces that f connects to through air inside the section
+    blocks = np.frombuffer(data, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+    graph = []
+    for sy in range(SECTIONS):
+        air = blocks[:, :, sy << SECTION_SHIFT:(sy + 1) << SECTION_SHIFT] == 0
+        if air.all():
+            graph.append((0x3F,) * 6)
+            continue
+        if not air.any():
+            graph.append((0,) * 6)
+            continue
+        # Label the air cells by connected component: spread the lowest cell index through air
+        # until stable. Labels are indices of cells in the same component, so each pass also
+        # jumps to the label of the labelling cell, which converges in far fewer passes
+        none = air.size
+        labels = np.where(air, np.arange(air.size).reshape(air.shape), none)
+        while True:
+            spread = labels.copy()
+            for a in range(3):
+                src, dst = np.moveaxis(labels, a, 0), np.moveaxis(spread, a, 0)
+                np.minimum(dst[1:], src[:-1], out=dst[1:])
+                np.minimum(dst[:-1], src[1:], out=dst[:-1])
+            spread[~air] = none
+            spread[air] = spread.ravel()[spread[air]]
+            if np.array_equal(spread, labels): break
+            labels = spread
+        # Components touching each face; the array is indexed [x, z, y]
+        slabs = (labels[-1], labels[0], labels[:, :, -1], labels[:, :, 0], labels[:, -1], labels[:, 0])
+        touching = [set(np.unique(s).tolist()) - {none} for s in slabs]
+        graph.append(tuple(sum(1 << g for g in range(6) if touching[f] & touching[g]) for f in range(6)))
+    return graph
+
+def visible_sections(cam, graphs):
+    # Cave culling: breadth-first flood fill from the camera's section through the per-section
+    # visibility graphs, never stepping back against a direction already taken. graphs maps
+    # (cx,cz) of the chunks in view range to section_connectivity (None = open air). Returns
+    # {(cx,cz): bitmask of reached sections} (None = no culling) and whether the fill leaves
+    # the range, i.e. whether the sky and distant terrain can be seen
+    sx, sy, sz = int(math.floor(cam.x)) >> CHUNK_SHIFT, int(math.floor(cam.y)) >> SECTION_SHIFT, int(math.floor(cam.z)) >> CHUNK_SHIFT
+    if not 0 <= sy < SECTIONS or (sx, sz) not in graphs: return None, True
+    visible = {(sx, sz): 1 << sy}
+    seen = {(sx, sy, sz)}
+    queue = deque([(sx, sy, sz, -1, 0)])
+    escaped = False
+    while queue:
+        x, y, z, entry, dirs = queue.popleft()
+        graph = graphs[(x, z)]
+        exits = 0x3F if entry < 0 or graph is None else graph[y][entry]
+        for g in range(6):
+            if not exits >> g & 1 or dirs >> OPPOSITE_FACE[g] & 1: continue
+            dx, dy, dz = FACE_DIRS[g]
+            nx, ny, nz = x + dx, y + dy, z + dz
+            if ny >= SECTIONS:
+                escaped = True
+                continue
+            if ny < 0 or (nx, ny, nz) in seen: continue
+            seen.add((nx, ny, nz))
+            visible[(nx, nz)] = visible.get((nx, nz), 0) | 1 << ny
+            if (nx, nz) not in graphs:
+                escaped = True
+                continue
+            queue.append((nx, ny, nz, OPPOSITE_FACE[g], dirs | 1 << g))
+    return visible, escaped
+
+def clip_near(pts):
+    # Clip a camera-space polygon against the near plane (Sutherland-Hodgman, one plane)
+    out = []
+    n = len(pts)
+    for i in range(n):
+        ax, ay, az = pts[i]
+        bx, by, bz = pts[(i+1) % n]
+        if az > NEAR_PLANE:
+            out.append(pts[i])
+        if (az > NEAR_PLANE) != (bz > NEAR_PLANE):
+            t = (NEAR_PLANE + 1e-6 - az) / (bz - az)
+            out.append((ax + (bx-ax)*t, ay + (by-ay)*t, NEAR_PLANE + 1e-6))
+    return out
+
+def clip_screen(pts):
+    # Clip a projected polygon to the screen rectangle; pygame rasterises huge off-screen
+    # polygons (e.g. merged quads just in front of the near plane) very slowly
+    for axis, lo, hi in ((0, 0.0, WIDTH), (1, 0.0, HEIGHT)):
+        for bound, inside in ((lo, lambda p, a=axis, b=lo: p[a] >= b), (hi, lambda p, a=axis, b=hi: p[a] <= b)):
+            out = []
+            n = len(pts)
+            for i in range(n):
+                p, q = pts[i], pts[(i+1) % n]
+                if inside(p):
+                    out.append(p)
+                if inside(p) != inside(q):
+                    t = (bound - p[axis]) / (q[axis] - p[axis])
+                    r = (p[0] + (q[0]-p[0])*t, p[1] + (q[1]-p[1])*t)
+                    out.append(r)
+            pts = out
+            if not pts: return pts
+    return pts
+
+def rasterise(colour, inv_depth, polys, cols, planes):
+    # Scanline-rasterise convex screen polygons into colour (WIDTH, HEIGHT) of mapped pixel
+    # values, depth-tested against inv_depth (WIDTH, HEIGHT): 1/z of the nearest fragment so
+    # far, 0 = empty. polys (n, V, 2) pads shorter polygons by repeating their last vertex;
+    # cols (n,) are mapped colours; 1/z over polygon i is planes[i] . (sx, sy, 1).
+    # Pixels are sampled at their centres
+    n = len(polys)
+    if n == 0: return
+    xs, ys = polys[:, :, 0], polys[:, :, 1]
+    dx, dy = np.roll(xs, -1, axis=1) - xs, np.roll(ys, -1, axis=1) - ys
+    area = (xs * dy - dx * ys).sum(axis=1)
+    # Every non-horizontal edge bounds its polygon's scanlines on the left or on the right,
+    # at x = slope*y + off; the other bound is made infinite so max/min ignore it
+    side = dy * np.where(area >= 0, 1.0, -1.0)[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(dy != 0, dx / dy, 0.0)
+    off = xs - slope * ys
+    left_slope, left_off = np.where(side < 0, slope, 0.0), np.where(side < 0, off, -np.inf)
+    right_slope, right_off = np.where(side > 0, slope, 0.0), np.where(side > 0, off, np.inf)
+    row0 = np.clip(np.ceil(ys.min(axis=1) - 0.5), 0, HEIGHT).astype(np.int64)
+    row1 = np.clip(np.floor(ys.max(axis=1) - 0.5), -1, HEIGHT - 1).astype(np.int64)
+    rows = np.where(np.abs(area) > 1e-9, np.maximum(row1 - row0 + 1, 0), 0)
+    # Batches of polygons whose bounding boxes add up to about RASTER_BATCH pixels
+    width = np.clip(xs.max(axis=1), 0, WIDTH) - np.clip(xs.min(axis=1), 0, WIDTH) + 1
+    batch = np.cumsum(rows * width) // RASTER_BATCH
+    bounds = np.flatnonzero(np.diff(batch)) + 1
+    colour_flat, depth_flat = colour.reshape(-1), inv_depth.reshape(-1)
+    for lo, hi in zip([0] + bounds.tolist(), bounds.tolist() + [n]):
+        r = rows[lo:hi]
+        total = int(r.sum())
+        if total == 0: continue
+        # One span per (polygon, scanline)
+        poly = np.repeat(np.arange(lo, hi), r)
+        sy = np.arange(total) - np.repeat(np.cumsum(r) - r, r) + np.repeat(row0[lo:hi], r)
+        yc = (sy + 0.5)[:, None]
+        left = (left_slope[poly] * yc + left_off[poly]).max(axis=1)
+        right = (right_slope[poly] * yc + right_off[poly]).min(axis=1)
+        col0 = np.clip(np.ceil(left - 0.5), 0, WIDTH).astype(np.int64)
+        span = np.maximum(np.clip(np.floor(right - 0.5), -1, WIDTH - 1).astype(np.int64) - col0 + 1, 0)
+        count = int(span.sum())
+        if count == 0: continue
+        keep = span > 0
+        poly, sy, col0, span = poly[keep], sy[keep], col0[keep], span[keep]
+        # Expand the spans into fragments; 1/z steps linearly along each span
+        pl = planes[poly]
+        z0 = pl[:, 0] * (col0 + 0.5) + pl[:, 1] * (sy + 0.5) + pl[:, 2]
+        line = np.repeat(np.arange(len(span)), span)
+        k = np.arange(count) - np.repeat(np.cumsum(span) - span, span)
+        pix = (col0 * HEIGHT + sy)[line] + k * HEIGHT
+        inv_z = z0[line] + pl[line, 0] * k
+        np.maximum.at(depth_flat, pix, inv_z)
+        won = inv_z >= depth_flat[pix]
+        colour_flat[pix[won]] = cols[poly][line[won]]
+
+class ChunkMesh:
+    # Faces of one chunk packed into arrays for batched transforms. Corners shared by
+    # neighbouring faces are stored once: verts holds the unique lattice points and
+    # quads (n,4) indexes into it, so each corner is transformed once per frame
+    def __init__(self, faces, chunk=None, connectivity=None):
+        # faces: list of (corners, normal, colour) or the same packed by pack_faces
+        if not isinstance(faces, np.ndarray): faces = pack_faces(faces)
+        self.count = len(faces)
+        corners = faces[:, :12].reshape(-1, 3)
+        verts, inverse = np.unique(corners, axis=0, return_inverse=True)
+        self.verts = verts.astype(np.float64)
+        self.quads = inverse.reshape(-1, 4).astype(np.int32)
+        self.normals = faces[:, 12:15].astype(np.int8)
+        self.colors = faces[:, 15:18].astype(np.uint8)
+        # Signed plane offset along the normal; the face is front-facing when normal . eye > plane
+        self.planes = (self.normals * corners[::4]).sum(axis=1)
+        # Bounding box for frustum culling
+        if self.count:
+            self.lo, self.hi = verts.min(axis=0), verts.max(axis=0)
+        else:
+            self.lo = self.hi = np.zeros(3)
+        self.centers = self.verts[self.quads].mean(axis=1) if self.count else np.zeros((0, 3))
+        # Average face height; decides whether the eye looks down or up at the chunk
+        self.surface_y = float(self.centers[:, 1].mean()) if self.count else 0.0
+        self._octant_orders = {}
+        # Cave culling (full-detail chunk meshes only): the chunk's section_connectivity, and for
+        # each face the section holding the air cell it is seen from, as a NEIGHBOUR_OFFSETS
+        # index (border faces are seen from the next chunk) and a section number
+        self.chunk = chunk
+        self.connectivity = connectivity
+        if chunk is not None and self.count:
+            air = corners.reshape(-1, 4, 3).min(axis=1) + np.minimum(self.normals, 0)
+            dcx, dcz = (air[:, 0] >> CHUNK_SHIFT) - chunk[0], (air[:, 2] >> CHUNK_SHIFT) - chunk[1]
+            self.air_chunk = np.where(dcx == 1, 1, np.where(dcx == -1, 2, np.where(dcz == 1, 3, np.where(dcz == -1, 4, 0))))
+            self.air_section = np.clip(air[:, 1] >> SECTION_SHIFT, 0, SECTIONS - 1)
+
+    def visible_faces(self, visible):
+        # Faces seen from a section reached by visible_sections; all of them for coarse meshes
+        if self.chunk is None: return True
+        cx, cz = self.chunk
+        bits = np.array([visible.get((cx + dx, cz + dz), 0) for dx, dz in NEIGHBOUR_OFFSETS])
+        return (bits[self.air_chunk] >> self.air_section & 1).astype(bool)
+
+    def octant_order(self, east, above, south):
+        # Faces far to near for an eye on the given side of the chunk on each axis
+        # (east: eye beyond max X, above: over the surface, south: beyond max Z)
+        key = (east, above, south)
+        order = self._octant_orders.get(key)
+        if order is None:
+            toward = np.array((1.0 if east else -1.0, 1.0 if above else -1.0, 1.0 if south else -1.0))
+            # Faces furthest away from the eye's side come first
+            order = np.argsort(self.centers @ toward, kind="stable")
+            self._octant_orders[key] = order
+        return order
+
+EMPTY_MESH = ChunkMesh([])
+
+class ChunkMeshCache:
+    # Per-chunk visible-face meshes, rebuilt only after an edit touches the chunk or its border.
+    # With workers (a MeshWorkers) full-detail meshes are built in the background: get() returns
+    # the chunk's previous mesh, or nothing, until update() installs the new one
+    def __init__(self, world, workers=None):
+        self.world = world
+        self.workers = workers
+        self.meshes = {}  # (cx,cz) -> ChunkMesh
+        self.stale = {}   # (cx,cz) -> outdated ChunkMesh drawn while its rebuild is in flight
+        self.lod = {}     # (cx,cz,step) -> coarse ChunkMesh of a distant chunk
+        self.version = 0  # bumped whenever a mesh that may be drawn is built, installed or dropped
+        self._retained = None
+        world.observers.append(self)
+
+    def get(self, cx, cz):
+        mesh = self.meshes.get((cx, cz))
+        if mesh is None:
+            # Not ready until the neighbours exist too, otherwise the border would be meshed twice
+            if not self.world.has_neighbourhood(cx, cz):
+                return EMPTY_MESH
+            if self.workers is not None:
+                self.workers.request(cx, cz)
+                return self.stale.get((cx, cz), EMPTY_MESH)
+            mesh = ChunkMesh(build_chunk_mesh(self.world, cx, cz), (cx, cz),
+                             section_connectivity(self.world.chunk_data(cx, cz)))
+            self.meshes[(cx, cz)] = mesh
+            self.version += 1
+        return mesh
+
+    def busy(self):
+        # Background meshing still owes meshes for the current view
+        return self.workers is not None and bool(self.workers.pending or self.workers.requests)
+
+    def update(self, cam):
+        # Install meshes the workers finished and hand them the chunks requested since last frame
+        if self.workers is None: return
+        for key, mesh, current in self.workers.finished():
+            if self._retained is not None and key not in self._retained: continue
+            if current:
+                self.meshes[key] = mesh
+                self.stale.pop(key, None)
+            else:
+                self.stale[key] = mesh  # edited while in flight: better than the older one
+            self.version += 1
+        self.workers.dispatch(self.world, cam)
+
+    def invalidate(self, cx, cz):
+        self.light_changed(cx, cz)
+        self.lod.pop((cx, cz, LOD_MID_STEP), None)
+        self.lod.pop((cx, cz, LOD_FAR_STEP), None)
+
+    def lod_meshes(self, cam, near, mid=LOD_MID_RADIUS, far=LOD_FAR_RADIUS):
+        # Coarse meshes of the chunks outside the full-detail chunk range near = (x0, x1, z0, z1),
+        # LOD_MID_STEP out to mid and LOD_FAR_STEP out to far. Missing ones are built nearest
+        # first, LOD_BUILDS_PER_FRAME per frame; coarse meshes that fall out of their ring are
+        # dropped
+        out, wanted, missing = [], set(), []
+        x, z = int(cam.x), int(cam.z)
+        far = int(far)
+        for ccx in range((x - far) >> CHUNK_SHIFT, ((x + far) >> CHUNK_SHIFT) + 1):
+            for ccz in range((z - far) >> CHUNK_SHIFT, ((z + far) >> CHUNK_SHIFT) + 1):
+                if near[0] <= ccx <= near[1] and near[2] <= ccz <= near[3]: continue
+                d = math.hypot((ccx + 0.5) * CHUNK_SIZE - cam.x, (ccz + 0.5) * CHUNK_SIZE - cam.z)
+                if d > far: continue
+                key = (ccx, ccz, LOD_MID_STEP if d <= mid else LOD_FAR_STEP)
+                wanted.add(key)
+                mesh = self.lod.get(key)
+                if mesh is None:
+                    missing.append((d, key))
+                elif mesh.count:
+                    out.append(mesh)
+        missing.sort()
+        for _, key in missing[:LOD_BUILDS_PER_FRAME]:
+            mesh = self.lod[key] = ChunkMesh(build_lod_mesh(self.world, *key))
+            self.version += 1
+            if mesh.count: out.append(mesh)
+        for key in [k for k in self.lod if k not in wanted]:
+            del self.lod[key]
+        return out
+
+    def retain(self, keys):
+        # Drop meshes of chunks outside keys (the region around the camera)
+        if keys is self._retained: return
+        self._retained = keys
+        self.world.retain(keys)
+        for key in [k for k in self.meshes if k not in keys]:
+            del self.meshes[key]
+        for key in [k for k in self.stale if k not in keys]:
+            del self.stale[key]
+
+    def block_changed(self, x, y, z):
+        cx, cz = x >> CHUNK_SHIFT, z >> CHUNK_SHIFT
+        self.invalidate(cx, cz)
+        # A block on the chunk border also exposes or hides a face of the neighbour chunk
+        lx, lz = x & CHUNK_MASK, z & CHUNK_MASK
+        if lx == 0: self.invalidate(cx-1, cz)
+        elif lx == CHUNK_MASK: self.invalidate(cx+1, cz)
+        if lz == 0: self.invalidate(cx, cz-1)
+        elif lz == CHUNK_MASK: self.invalidate(cx, cz+1)
+
+    def light_changed(self, cx, cz):
+        # Light is baked into full-detail meshes only
+        mesh = self.meshes.pop((cx, cz), None)
+        self.version += 1
+        if self.workers is not None:
+            self.workers.outdated(cx, cz)
+            if mesh is not None: self.stale[(cx, cz)] = mesh
+
+    def chunk_changed(self, cx, cz):
+        self.invalidate(cx, cz)
+
+    def chunk_loaded(self, cx, cz):
+        # Neighbours meshed their border against missing terrain (air)
+        self.invalidate(cx, cz)
+        for dx, dz in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            self.invalidate(cx+dx, cz+dz)
+
+def lod_radii(radius):
+    # LOD_MID_RADIUS and LOD_FAR_RADIUS scaled with the render radius, within FAR_PLANE
+    k = radius / RENDER_RADIUS
+    return min(LOD_MID_RADIUS * k, FAR_PLANE), min(LOD_FAR_RADIUS * k, FAR_PLANE)
+
+# ---------- Background meshing ----------
+class MeshWorkers:
+    # Builds full-detail chunk meshes on a process pool, nearest requested chunk first. A chunk
+    # and its four neighbours, blocks and light, reach a worker through a shared-memory slot,
+    # and the packed faces come back in a shared block the worker creates, so only names and
+    # counts are pickled
+    def __init__(self, workers=MESH_WORKERS):
+        self.max_pending = workers * 2
+        # One input slot per job in flight, created before the pool starts so the workers share
+        # this process's resource tracker for the blocks they create
+        self.slots = [shared_memory.SharedMemory(create=True, size=2 * len(NEIGHBOUR_OFFSETS) * CHUNK_VOLUME)
+                      for _ in range(self.max_pending)]
+        self.free = list(self.slots)
+        # spawn, not fork: the game already runs generator threads
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.pending = {}      # (cx,cz) -> (Future, slot)
+        self.requests = set()  # (cx,cz) asked for since the last dispatch
+        self.edited = set()    # pending chunks edited after their job was submitted
+
+    def request(self, cx, cz):
+        if (cx, cz) not in self.pending:
+            self.requests.add((cx, cz))
+
+    def outdated(self, cx, cz):
+        if (cx, cz) in self.pending:
+            self.edited.add((cx, cz))
+
+    def dispatch(self, world, cam):
+        requests, self.requests = self.requests, set()
+        order = sorted(requests, key=lambda k: math.hypot((k[0] + 0.5) * CHUNK_SIZE - cam.x, (k[1] + 0.5) * CHUNK_SIZE - cam.z))
+        for cx, cz in order[:len(self.free)]:
+            slot = self.free.pop()
+            present = 0
+            for dx, dz in NEIGHBOUR_OFFSETS:
+                world.light(cx + dx, cz + dz)  # lighting one can relight the others
+            for i, (dx, dz) in enumerate(NEIGHBOUR_OFFSETS):
+                data = world.chunk_data(cx + dx, cz + dz)
+                if data is not None:
+                    slot.buf[i * CHUNK_VOLUME:(i + 1) * CHUNK_VOLUME] = data
+                    j = i + len(NEIGHBOUR_OFFSETS)
+                    slot.buf[j * CHUNK_VOLUME:(j + 1) * CHUNK_VOLUME] = world.light(cx + dx, cz + dz)
+                    present |= 1 << i
+            self.pending[(cx, cz)] = (self.pool.submit(mesh_job, slot.name, cx, cz, present), slot)
+
+    def finished(self, budget=MESH_INSTALL_PER_FRAME):
+        # (key, ChunkMesh, still up to date) for up to budget completed jobs
+        out = []
+        for key in [k for k, (fut, _) in self.pending.items() if fut.done()][:budget]:
+            fut, slot = self.pending.pop(key)
+            self.free.append(slot)
+            name, count = fut.result()
+            block = shared_memory.SharedMemory(name)
+            words = np.ndarray(SECTIONS * 6 + count * FACE_WORDS, dtype=np.int32, buffer=block.buf)
+            graph = [tuple(row) for row in words[:SECTIONS * 6].reshape(SECTIONS, 6).tolist()]
+            faces = words[SECTIONS * 6:].reshape(count, FACE_WORDS).copy()
+            del words
+            block.close()
+            block.unlink()
+            out.append((key, ChunkMesh(faces, key, graph), key not in self.edited))
+            self.edited.discard(key)
+        return out
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        for fut, _ in self.pending.values():
+            if fut.cancelled() or fut.exception() is not None: continue
+            block = shared_memory.SharedMemory(fut.result()[0])
+            block.close()
+            block.unlink()
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
+
+def mesh_job(slot_name, cx, cz, present):
+    # Runs in a MeshWorkers process: mesh the chunk in the slot (blocks then light of the chunks
+    # in NEIGHBOUR_OFFSETS order, bit i of present set when chunk i exists) and return the name
+    # of a new shared block holding its section connectivity and packed faces, and the face count
+    world = World()
+    slot = shared_memory.SharedMemory(slot_name)
+    for i, (dx, dz) in enumerate(NEIGHBOUR_OFFSETS):
+        if present >> i & 1:
+            j = i + len(NEIGHBOUR_OFFSETS)
+            world.chunks[(cx + dx, cz + dz)] = bytearray(slot.buf[i * CHUNK_VOLUME:(i + 1) * CHUNK_VOLUME])
+            world._light[(cx + dx, cz + dz)] = bytearray(slot.buf[j * CHUNK_VOLUME:(j + 1) * CHUNK_VOLUME])
+    slot.close()
+    faces = pack_faces(build_chunk_mesh(world, cx, cz))
+    graph = np.array(section_connectivity(world.chunks[(cx, cz)]), dtype=np.int32).ravel()
+    block = shared_memory.SharedMemory(create=True, size=(graph.size + faces.size) * 4)
+    words = np.ndarray(graph.size + faces.size, dtype=np.int32, buffer=block.buf)
+    words[:graph.size] = graph
+    words[graph.size:] = faces.ravel()
+    del words
+    block.close()
+    return block.name, len(faces)
+
+def render_world(screen, cam, world, cx, cz, meshes, generator=None, prof=None, backend=RENDER_BACKEND, radius=RENDER_RADIUS):
+    # Returns the number of polygons drawn. radius: full-detail render radius in blocks; the
+    # LOD rings scale with it (see lod_radii)
+    if prof is None: prof = NULL_PROFILER
+    minx, maxx = int(cam.x - radius), int(cam.x + radius)
+    minz, maxz = int(cam.z - radius), int(cam.z + radius)
+
+    # Ensure terrain generated around camera, one chunk further out so edge chunks can be meshed.
+    # With a generator this only queues work; chunks that are not ready yet are skipped
+    if generator is not None:
+        generator.update(cam, radius + CHUNK_SIZE)
+    else:
+        world.populate_region(int(round(cam.x)), int(round(cam.z)), radius + CHUNK_SIZE)
+    meshes.retain(world.region_chunks(int(round(cam.x)), int(round(cam.z)), radius + CHUNK_SIZE))
+    meshes.update(cam)
+    prof.mark("populate")
+
+    near = {}
+    for ccx in range(minx >> CHUNK_SHIFT, (maxx >> CHUNK_SHIFT) + 1):
+        for ccz in range(minz >> CHUNK_SHIFT, (maxz >> CHUNK_SHIFT) + 1):
+            near[(ccx, ccz)] = meshes.get(ccx, ccz)
+    # Cave culling: keep only faces seen from sections the camera can reach through air;
+    # chunks left without any are skipped entirely
+    visible, open_sky = visible_sections(cam, {key: m.connectivity for key, m in near.items()})
+    chunk_meshes, shown = [], []
+    for mesh in near.values():
+        if not mesh.count: continue
+        mask = True if visible is None else mesh.visible_faces(visible)
+        if mask is True or mask.any():
+            chunk_meshes.append(mesh)
+            shown.append(mask)
+    # Distant chunks beyond the full-detail square, at coarser levels of detail; hidden when
+    # the fill never gets out of the square (e.g. underground)
+    if open_sky:
+        lods = meshes.lod_meshes(cam, (minx >> CHUNK_SHIFT, maxx >> CHUNK_SHIFT, minz >> CHUNK_SHIFT, maxz >> CHUNK_SHIFT),
+                                 *lod_radii(radius))
+        chunk_meshes += lods
+        shown += [True] * len(lods)
+    if not chunk_meshes: return 0
+    view = cam.view_matrix()
+    eye = np.array((cam.x, cam.y, cam.z))
+
+    # Frustum culling per chunk against its mesh bounds
+    lo = np.array([m.lo for m in chunk_meshes])
+    hi = np.array([m.hi for m in chunk_meshes])
+    in_view = cam.boxes_visible(lo, hi, view)
+    # Back to front: chunks ordered by distance of their centre from the eye
+    dist = (((lo + hi) * 0.5 - eye) ** 2).sum(axis=1)
+    keep = [i for i in np.argsort(-dist).tolist() if in_view[i]]
+    chunk_meshes, shown = [chunk_meshes[i] for i in keep], [shown[i] for i in keep]
+    if not chunk_meshes: return 0
+
+    # Back-face culling per face: the eye must be on the outer side of the face plane
+    facing = [((m.normals @ eye) > m.planes) & s for m, s in zip(chunk_meshes, shown)]
+
+    # Stack the chunks' vertex and index buffers, offsetting each chunk's indices
+    offsets = np.cumsum([0] + [len(m.verts) for m in chunk_meshes[:-1]])
+    lattice = np.concatenate([m.verts for m in chunk_meshes])
+    quads = np.concatenate([m.quads[f] + off for m, f, off in zip(chunk_meshes, facing, offsets.tolist())])
+    colors = np.concatenate([m.colors[f] for m, f in zip(chunk_meshes, facing)])
+    if not len(quads): return 0
+    prof.mark("gather")
+
+    # Transform and project every unique corner once, then gather per face
+    lattice_cam = cam.transform_points(lattice, view)
+    lattice_scr, lattice_front = cam.project_points(lattice_cam)
+    verts, scr, front = lattice_cam[quads], lattice_scr[quads], lattice_front[quads]
+    xs, ys = scr[:, :, 0], scr[:, :, 1]
+    xmin, xmax, ymin, ymax = xs.min(axis=1), xs.max(axis=1), ys.min(axis=1), ys.max(axis=1)
+    all_front = front.all(axis=1)
+    on_screen = (xmax >= 0) & (xmin <= WIDTH) & (ymax >= 0) & (ymin <= HEIGHT)
+    oversized = (xmin < -WIDTH) | (xmax > 2*WIDTH) | (ymin < -HEIGHT) | (ymax > 2*HEIGHT)
+    # Common case: fully in front of the near plane and of sane screen size
+    easy = all_front & on_screen & ~oversized
+    # Faces crossing the near plane or projecting far off-screen are clipped one by one
+    hard = (all_front & on_screen & oversized) | (front.any(axis=1) & ~all_front)
+    prof.mark("project")
+
+    if backend == "zbuffer":
+        # No sort: the depth buffer resolves visibility
+        normals = np.concatenate([m.normals[f] for m, f in zip(chunk_meshes, facing)])
+        drawn = draw_zbuffer(screen, cam, view, verts, scr, colors, normals, easy | hard, all_front)
+        prof.mark("draw")
+        return drawn
+
+    # Draw order: chunks back to front, faces inside each chunk pre-ordered (see face_order)
+    order = face_order(chunk_meshes, facing, verts[:, :, 2].mean(axis=1), eye)
+    order = order[(easy | hard)[order]]
+    prof.mark("sort")
 
     # Draw
-    for depth, pts, col in faces_to_draw:
+    drawn = 0
+    for i, pts, col in zip(order.tolist(), scr[order].tolist(), colors[order].tolist()):
+        if hard[i]:
+            pts_cam = verts[i].tolist()
+            if not all_front[i]:
+                # Merged quads can reach behind the camera; keep the part in front
+                pts_cam = clip_near(pts_cam)
+                if len(pts_cam) < 3:
+                    continue
+            pts = [cam.project(*v) for v in pts_cam]
+            xs_i = [p[0] for p in pts]
+            ys_i = [p[1] for p in pts]
+            if max(xs_i) < 0 or min(xs_i) > WIDTH or max(ys_i) < 0 or min(ys_i) > HEIGHT:
+                continue  # entirely off-screen
+            pts = clip_screen(pts)
+            if len(pts) < 3:
+                continue
         pygame.draw.polygon(screen, col, pts)
+        drawn += 1
+    prof.mark("draw")
+    return drawn
+
+def draw_zbuffer(screen, cam, view, quads_cam, quads_scr, colors, normals, show, all_front):
+    # zbuffer backend: rasterise the shown quads over the current screen contents and blit the
+    # result back in one go; returns the number of polygons rasterised
+    idx = np.flatnonzero(show)
+    polys = np.empty((len(idx), 5, 2))
+    polys[:, :4] = quads_scr[idx]
+    polys[:, 4] = quads_scr[idx, 3]
+    # Quads crossing the near plane: keep the part in front (at most 5 corners)
+    for k in np.flatnonzero(~all_front[idx]).tolist():
+        pts = [cam.project(*v) for v in clip_near(quads_cam[idx[k]].tolist())]
+        if len(pts) < 3:
+            pts = [(0.0, 0.0)]  # nothing left: zero area, never rasterised
+        polys[k, :len(pts)] = pts
+        polys[k, len(pts):] = pts[-1]
+    # 1/z is linear in screen space over a plane n.p = d (camera space):
+    # 1/z = (n_x (sx - W/2)/f - n_y (sy - H/2)/f + n_z) / d
+    nc = normals[idx] @ view.T
+    d = (nc * quads_cam[idx, 0]).sum(axis=1)
+    d = np.where(np.abs(d) > 1e-9, d, 1e-9)
+    planes = np.stack([nc[:, 0] / (cam.f * d), -nc[:, 1] / (cam.f * d),
+                       (nc[:, 2] - nc[:, 0] * WIDTH*0.5 / cam.f + nc[:, 1] * HEIGHT*0.5 / cam.f) / d], axis=1)
+    colour = pygame.surfarray.array2d(screen)
+    rasterise(colour, np.zeros((WIDTH, HEIGHT)), polys, pygame.surfarray.map_array(screen, colors[idx]), planes)
+    pygame.surfarray.blit_array(screen, colour)
+    return len(idx)
+
+def face_order(chunk_meshes, facing, depth, eye):
+    # Far-to-near indices into the stacked (back-face culled) faces of chunk_meshes, which
+    # are already sorted back to front. A chunk entirely to one side of the eye on X and Z
+    # reuses its cached per-octant order; a chunk the eye stands over or beside (sharing an
+    # X or Z range) falls back to a radix sort on quantised depth
+    parts = []
+    start = 0
+    ex, ey, ez = eye.tolist()
+    for m, f in zip(chunk_meshes, facing):
+        n = int(np.count_nonzero(f))
+        if n == 0: continue
+        lo, hi = m.lo, m.hi
+        if lo[0] <= ex <= hi[0] or lo[2] <= ez <= hi[2]:
+            q = np.clip(depth[start:start+n] * (65535.0 / FAR_PLANE), 0, 65535).astype(np.uint16)
+            local = np.argsort(65535 - q, kind="stable")  # 16-bit keys: NumPy uses radix sort
+        else:
+            local = m.octant_order(ex > hi[0], ey > m.surface_y, ez > hi[2])
+            # Keep only front faces, renumbered to their position among the facing faces
+            local = (np.cumsum(f) - 1)[local[f[local]]]
+        parts.append(local + start)
+        start += n
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+# ---------- Player collision ----------
+def player_box(cam):
+    half = PLAYER_WIDTH / 2
+    foot = cam.y - PLAYER_EYE
+    return [cam.x - half, foot, cam.z - half, cam.x + half, foot + PLAYER_HEIGHT, cam.z + half]
+
+def cell_solid(world, chunks, x, y, z):
+    # chunks caches block arrays by chunk key for the duration of one move
+    if not 0 <= y < WORLD_HEIGHT: return y < 0
+    key = (x >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+    data = chunks.get(key, False)
+    if data is False:
+        data = chunks[key] = world.chunk_data(*key)
+    if data is None:
+        # Not generated yet: only the terrain surface is known
+        return y < world.height_at(x, z)  # height_at is the first air cell above the terrain
+    return SOLID[data[((x & CHUNK_MASK) << CHUNK_SHIFT | (z & CHUNK_MASK)) << HEIGHT_SHIFT | y]]
+
+def sweep_axis(world, chunks, box, axis, d):
+    # Distance the box can move along axis (0=x, 1=y, 2=z) towards d before it touches a
+    # solid cell. Only the layers of cells its leading face crosses are looked at, each over
+    # the box's cross-section; cells it already overlaps never block, so it can leave them
+    if d == 0: return 0.0
+    u, v = (axis + 1) % 3, (axis + 2) % 3
+    us = range(math.floor(box[u] + 1e-9), math.ceil(box[u+3] - 1e-9))
+    vs = range(math.floor(box[v] + 1e-9), math.ceil(box[v+3] - 1e-9))
+    if d > 0:
+        lead = box[axis+3]
+        layers, face = range(math.ceil(lead - 1e-9), math.floor(lead + d) + 1), 0
+    else:
+        lead = box[axis]
+        layers, face = range(math.floor(lead + 1e-9) - 1, math.floor(lead + d) - 1, -1), 1
+    cell = [0, 0, 0]
+    for c in layers:
+        cell[axis] = c
+        for a in us:
+            cell[u] = a
+            for b in vs:
+                cell[v] = b
+                if cell_solid(world, chunks, *cell):
+                    return min(d, c + face - lead) if d > 0 else max(d, c + face - lead)
+    return d
+
+def move_player(world, cam, delta):
+    # Moves the camera's box by delta one axis at a time (y first, so landing is resolved
+    # before sliding along walls). Returns the per-axis flags of the moves that were blocked
+    box = player_box(cam)
+    chunks = {}
+    blocked = [False, False, False]
+    for axis in (1, 0, 2):
+        moved = sweep_axis(world, chunks, box, axis, delta[axis])
+        blocked[axis] = moved != delta[axis]
+        box[axis] += moved
+        box[axis+3] += moved
+    cam.x, cam.y, cam.z = box[0] + PLAYER_WIDTH / 2, box[1] + PLAYER_EYE, box[2] + PLAYER_WIDTH / 2
+    return blocked
 
 # ---------- Picking (3D DDA voxel traversal) ----------
 def raycast_voxels(world, origin, direction, max_dist=BUILD_REACH):
+    # Empty space is crossed in one jump instead of voxel by voxel, using the coarsest empty
+    # box the occupancy map gives: the part of a chunk above its highest solid brick (all of
+    # it for an all-air chunk), else an empty brick
     ox, oy, oz = origin
     dx, dy, dz = direction
     # Start voxel
     x, y, z = math.floor(ox), math.floor(oy), math.floor(oz)
 
-    # Handle zero components
-    def inv(v): return 1e30 if abs(v) < 1e-8 else 1.0/v
-
     stepX = 1 if dx > 0 else -1
     stepY = 1 if dy > 0 else -1
     stepZ = 1 if dz > 0 else -1
 
-    tDeltaX = abs(inv(dx))
-    tDeltaY = abs(inv(dy))
-    tDeltaZ = abs(inv(dz))
+    # Ray length per voxel along each axis and up to the first voxel boundary;
+    # an axis the ray does not move along is never stepped
+    tDeltaX = abs(1.0/dx) if abs(dx) > 1e-8 else 1e30
+    tDeltaY = abs(1.0/dy) if abs(dy) > 1e-8 else 1e30
+    tDeltaZ = abs(1.0/dz) if abs(dz) > 1e-8 else 1e30
+    tMaxX = (x + (stepX > 0) - ox) / dx if abs(dx) > 1e-8 else 1e30
+    tMaxY = (y + (stepY > 0) - oy) / dy if abs(dy) > 1e-8 else 1e30
+    tMaxZ = (z + (stepZ > 0) - oz) / dz if abs(dz) > 1e-8 else 1e30
 
-    # Distance to the first voxel boundary
-    def first_t(o, d, i, step):
-        # Boundary at i if step<0 else i+1
-        boundary = i + (1 if step > 0 else 0)
-        return (boundary - o) / (d if abs(d) > 1e-8 else 1e-8)
-
-    tMaxX = first_t(ox, dx, x, stepX)
-    tMaxY = first_t(oy, dy, y, stepY)
-    tMaxZ = first_t(oz, dz, z, stepZ)
-
-    prev = (x, y, z)
     face = (0, 0, 0)
     t = 0.0
+    key = None
     while t <= max_dist:
-        # Check block
+        if (x >> CHUNK_SHIFT, z >> CHUNK_SHIFT) != key:
+            key = (x >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+            occ = world.occupancy(*key)
+            data = world.chunk_data(*key) if occ is not None else None
+            top = world.solid_top(*key)
+        if not 0 <= y < WORLD_HEIGHT:
+            if (y < 0 and dy <= 0) or (y >= WORLD_HEIGHT and dy >= 0):
+                return None  # heading away from the world
+            loX, loY, loZ, sX, sY, sZ = x & ~(BRICK_SIZE-1), y & ~(BRICK_SIZE-1), z & ~(BRICK_SIZE-1), BRICK_SIZE, BRICK_SIZE, BRICK_SIZE
+        elif y >= top:
+            # Above everything in this chunk: jump to where the ray leaves that slab
+            loX, loY, loZ, sX, sY, sZ = key[0] << CHUNK_SHIFT, top, key[1] << CHUNK_SHIFT, CHUNK_SIZE, WORLD_HEIGHT - top, CHUNK_SIZE
+        else:
+            lx, lz = x & CHUNK_MASK, z & CHUNK_MASK
+            if occ[((lx >> BRICK_SHIFT << BRICKS_SHIFT | lz >> BRICK_SHIFT) << BRICKS_HEIGHT_SHIFT) | y >> BRICK_SHIFT]:
+                # Check block
+                if data[((lx << CHUNK_SHIFT | lz) << HEIGHT_SHIFT) | y]:
+                    return (x, y, z, face, t)
+                # Step
+                if tMaxX < tMaxY:
+                    if tMaxX < tMaxZ:
+                        x += stepX
+                        t = tMaxX
+                        tMaxX += tDeltaX
+                        face = (-stepX, 0, 0)
+                    else:
+                        z += stepZ
+                        t = tMaxZ
+                        tMaxZ += tDeltaZ
+                        face = (0, 0, -stepZ)
+                else:
+                    if tMaxY < tMaxZ:
+                        y += stepY
+                        t = tMaxY
+                        tMaxY += tDeltaY
+                        face = (0, -stepY, 0)
+                    else:
+                        z += stepZ
+                        t = tMaxZ
+                        tMaxZ += tDeltaZ
+                        face = (0, 0, -stepZ)
+                continue
+            loX, loY, loZ, sX, sY, sZ = x & ~(BRICK_SIZE-1), y & ~(BRICK_SIZE-1), z & ~(BRICK_SIZE-1), BRICK_SIZE, BRICK_SIZE, BRICK_SIZE
+        # Jump out of the empty box: voxel steps left along each axis, the ray length
+        # at which it exits, and how many steps every axis has taken by then
+        nX = loX + sX - x if stepX > 0 else x - loX + 1
+        nY = loY + sY - y if stepY > 0 else y - loY + 1
+        nZ = loZ + sZ - z if stepZ > 0 else z - loZ + 1
+        exitX = tMaxX + (nX - 1) * tDeltaX
+        exitY = tMaxY + (nY - 1) * tDeltaY
+        exitZ = tMaxZ + (nZ - 1) * tDeltaZ
+        t = min(exitX, exitY, exitZ)
+        if t > max_dist: return None
+        kX = nX if exitX == t else max(0, math.ceil((t - tMaxX) / tDeltaX))
+        kY = nY if exitY == t else max(0, math.ceil((t - tMaxY) / tDeltaY))
+        kZ = nZ if exitZ == t else max(0, math.ceil((t - tMaxZ) / tDeltaZ))
+        x, y, z = x + stepX*kX, y + stepY*kY, z + stepZ*kZ
+        tMaxX, tMaxY, tMaxZ = tMaxX + kX*tDeltaX, tMaxY + kY*tDeltaY, tMaxZ + kZ*tDeltaZ
+        face = (-stepX, 0, 0) if exitX == t else (0, -stepY, 0) if exitY == t else (0, 0, -stepZ)
+    return None
+
+def raycast_batch(world, origins, directions, max_dist=BUILD_REACH):
+    # raycast_voxels for (n,3) arrays of rays at once: each pass moves every ray one voxel on,
+    # or across the same empty boxes. Returns (hit, voxel, face, t) arrays; voxel, face and t
+    # only mean something where hit is True
+    o = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    d = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    # Blocks, occupancy and solid tops of every chunk the rays can reach, gathered once into
+    # arrays indexed by chunk offset from (cx0, cz0); terrain not generated reads as air
+    cx0, cz0 = int(math.floor(o[:, 0].min() - max_dist - 1)) >> CHUNK_SHIFT, int(math.floor(o[:, 2].min() - max_dist - 1)) >> CHUNK_SHIFT
+    cx1, cz1 = int(math.floor(o[:, 0].max() + max_dist + 1)) >> CHUNK_SHIFT, int(math.floor(o[:, 2].max() + max_dist + 1)) >> CHUNK_SHIFT
+    blocks = np.zeros((cx1 - cx0 + 1, cz1 - cz0 + 1, CHUNK_VOLUME), dtype=np.uint8)
+    bricks = np.zeros((cx1 - cx0 + 1, cz1 - cz0 + 1, len(EMPTY_OCCUPANCY)), dtype=np.uint8)
+    tops = np.zeros((cx1 - cx0 + 1, cz1 - cz0 + 1), dtype=np.int64)
+    for cx in range(cx0, cx1 + 1):
+        for cz in range(cz0, cz1 + 1):
+            occ = world.occupancy(cx, cz)
+            if occ is None: continue
+            blocks[cx - cx0, cz - cz0] = np.frombuffer(world.chunk_data(cx, cz), dtype=np.uint8)
+            bricks[cx - cx0, cz - cz0] = np.frombuffer(occ, dtype=np.uint8)
+            tops[cx - cx0, cz - cz0] = world.solid_top(cx, cz)
+    pos = np.floor(o).astype(np.int64)
+    step = np.where(d > 0, 1, -1)
+    moving = np.abs(d) > 1e-8
+    d_safe = np.where(moving, d, 1.0)
+    t_delta = np.where(moving, np.abs(1.0 / d_safe), 1e30)
+    t_max = np.where(moving, (pos + (step > 0) - o) / d_safe, 1e30)
+    t = np.zeros(len(o))
+    face = np.zeros((len(o), 3), dtype=np.int64)
+    hit = np.zeros(len(o), dtype=bool)
+    active = np.arange(len(o))
+    while len(active):
+        p = pos[active]
+        x, y, z = p[:, 0], p[:, 1], p[:, 2]
+        ix, iz, lx, lz = (x >> CHUNK_SHIFT) - cx0, (z >> CHUNK_SHIFT) - cz0, x & CHUNK_MASK, z & CHUNK_MASK
+        inside = (y >= 0) & (y < WORLD_HEIGHT)
+        yc = np.where(inside, y, 0)
+        ids = np.where(inside, blocks[ix, iz, ((lx << CHUNK_SHIFT | lz) << HEIGHT_SHIFT) | yc], 0)
+        counts = np.where(inside, bricks[ix, iz, ((lx >> BRICK_SHIFT << BRICKS_SHIFT | lz >> BRICK_SHIFT) << BRICKS_HEIGHT_SHIFT) | yc >> BRICK_SHIFT], 0)
+        top = tops[ix, iz]
+        hit[active[ids != 0]] = True
+        away = ((y < 0) & (d[active, 1] <= 0)) | ((y >= WORLD_HEIGHT) & (d[active, 1] >= 0))
+        keep = (ids == 0) & ~away
+        active, p, counts, top = active[keep], p[keep], counts[keep], top[keep]
+        rows = np.arange(len(active))
+        # Same jumps as raycast_voxels, with a one-voxel box for rays in occupied bricks
+        size = np.where(counts == 0, BRICK_SIZE, 1)[:, None].repeat(3, axis=1)
+        lo = p // size * size
+        above = (p[:, 1] >= top) & (p[:, 1] < WORLD_HEIGHT)
+        lo[above] = np.stack([p[above, 0] & ~CHUNK_MASK, top[above], p[above, 2] & ~CHUNK_MASK], axis=1)
+        size[above] = np.stack([np.full(above.sum(), CHUNK_SIZE), WORLD_HEIGHT - top[above], np.full(above.sum(), CHUNK_SIZE)], axis=1)
+        s, tm, td = step[active], t_max[active], t_delta[active]
+        n = np.where(s > 0, lo + size - p, p - lo + 1)
+        exits = tm + (n - 1) * td
+        axis = exits.argmin(axis=1)
+        t_exit = exits[rows, axis]
+        k = np.maximum(0, np.ceil((t_exit[:, None] - tm) / td)).astype(np.int64)
+        k[rows, axis] = n[rows, axis]
+        pos[active] = p + s * k
+        t_max[active] = tm + k * td
+        f = np.zeros((len(active), 3), dtype=np.int64)
+        f[rows, axis] = -s[rows, axis]
+        face[active] = f
+        t[active] = t_exit
+        active = active[t_exit <= max_dist]
+    return hit, pos, face, t
+
+# ---------- Block ticks ----------
+# Blocks that have scheduled updates, as a lookup table over block ids
+TICKABLE = np.zeros(256, dtype=bool)
+TICKABLE[list(TICK_DELAY)] = True
+SIDES = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+class BlockTicks:
+    # Scheduled block updates: a heap of (tick, x, y, z) fed by block changes. Only blocks with
+    # a TICK_DELAY are ever queued, each position once, and at most TICK_BUDGET updates run per
+    # tick; the rest stay queued, so a big flood spreads over more ticks instead of stalling a frame
+    def __init__(self, world):
+        self.world = world
+        self.tick = 0
+        self.clock = 0.0        # fraction of a tick carried between frames
+        self.queue = []         # heap of (tick, x, y, z)
+        self.scheduled = set()  # (x,y,z) in the queue
+        world.observers.append(self)
+
+    def schedule(self, x, y, z):
+        if (x, y, z) in self.scheduled: return
+        delay = TICK_DELAY.get(self.world.get_block(x, y, z))
+        if delay is None: return
+        self.scheduled.add((x, y, z))
+        heapq.heappush(self.queue, (self.tick + delay, x, y, z))
+
+    def block_changed(self, x, y, z):
+        # The block and its neighbours may have to fall or flow now
+        self.schedule(x, y, z)
+        for dx, dy, dz in FACE_DIRS:
+            self.schedule(x + dx, y + dy, z + dz)
+
+    def chunk_changed(self, cx, cz):
+        # Bulk edit: every tickable block of the chunk
+        data = self.world.chunk_data(cx, cz)
+        if data is None: return
+        blocks = np.frombuffer(data, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE, WORLD_HEIGHT)
+        for lx, lz, y in zip(*np.nonzero(TICKABLE[blocks])):
+            self.schedule((cx << CHUNK_SHIFT) + int(lx), int(y), (cz << CHUNK_SHIFT) + int(lz))
+
+    def chunk_loaded(self, cx, cz): pass
+
+    def light_changed(self, cx, cz): pass
+
+    def update(self, dt):
+        # Run the ticks that fell due over dt seconds; returns the number of block updates run
+        self.clock = min(self.clock + dt * TICK_RATE, TICK_CATCHUP)
+        count = 0
+        while self.clock >= 1.0:
+            self.clock -= 1.0
+            count += self.run_tick()
+        return count
+
+    def run_tick(self):
+        self.tick += 1
+        queue, count = self.queue, 0
+        while queue and queue[0][0] <= self.tick and count < TICK_BUDGET:
+            _, x, y, z = heapq.heappop(queue)
+            self.scheduled.discard((x, y, z))
+            self.update_block(x, y, z)
+            count += 1
+        return count
+
+    def update_block(self, x, y, z):
+        world = self.world
         bid = world.get_block(x, y, z)
-        if bid != 0:
-            return (x, y, z, face, t)
-        # Step
-        if tMaxX < tMaxY:
-            if tMaxX < tMaxZ:
-                x += stepX
-                t = tMaxX
-                tMaxX += tDeltaX
-                face = (-stepX, 0, 0)
+        if bid == 7:
+            # Sand falls through air and water, one block per update
+            below = world.get_block(x, y - 1, z)
+            if y > 0 and (below == 0 or WATER <= below <= WATER + WATER_REACH):
+                world.set_block(x, y, z, 0)
+                world.set_block(x, y - 1, z, bid)
+        elif WATER <= bid <= WATER + WATER_REACH:
+            self.flow(x, y, z, bid - WATER)
+
+    def flow(self, x, y, z, level):
+        # Water: a flowing block keeps the level its feed gives it (1 under water, else one more
+        # than its closest horizontal neighbour) and dries up without one. Water falls straight
+        # down into air, and spreads sideways only from solid ground, up to WATER_REACH blocks
+        world = self.world
+        if level:
+            if WATER <= world.get_block(x, y + 1, z) <= WATER + WATER_REACH:
+                feed = 1
             else:
-                z += stepZ
-                t = tMaxZ
-                tMaxZ += tDeltaZ
-                face = (0, 0, -stepZ)
+                levels = [world.get_block(x + dx, y, z + dz) - WATER for dx, dz in SIDES]
+                feed = min([l for l in levels if 0 <= l <= WATER_REACH] or [WATER_REACH]) + 1
+            if feed != level:
+                world.set_block(x, y, z, WATER + feed if feed <= WATER_REACH else 0)
+                return
+        if y == 0: return
+        below = world.get_block(x, y - 1, z)
+        if below == 0:
+            world.set_block(x, y - 1, z, WATER + 1)
+        elif not WATER <= below <= WATER + WATER_REACH and level < WATER_REACH:
+            for dx, dz in SIDES:
+                if world.get_block(x + dx, y, z + dz) == 0:
+                    world.set_block(x + dx, y, z + dz, WATER + level + 1)
+
+# ---------- Frame profiler ----------
+class FrameProfiler:
+    # Wall time per stage of each frame. mark(stage) charges the time since the previous
+    # mark to that stage; a rolling history feeds the overlay and rows can stream to CSV
+    STAGES = ("input", "physics", "populate", "gather", "project", "sort", "draw", "hud", "flip")
+    COLORS = {
+        "input": (200, 200, 200), "physics": (120, 200, 255), "populate": (255, 170, 60),
+        "gather": (255, 230, 90), "project": (120, 230, 120), "sort": (230, 120, 230),
+        "draw": (240, 80, 80), "hud": (150, 150, 255), "flip": (90, 90, 90),
+    }
+
+    def __init__(self, history=PROFILE_HISTORY, csv_path=None):
+        self.history = []  # per-frame dicts stage -> ms, newest last
+        self.max_history = history
+        self.frame = 0
+        self.current = None
+        self._last = 0.0
+        self._csv_file = self._csv = None
+        if csv_path:
+            self._csv_file = open(csv_path, "w", newline="")
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(("frame", "total_ms") + self.STAGES)
+
+    def begin_frame(self):
+        self.current = dict.fromkeys(self.STAGES, 0.0)
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.current[stage] += (now - self._last) * 1000.0
+        self._last = now
+
+    def end_frame(self):
+        sample = self.current
+        self.history.append(sample)
+        if len(self.history) > self.max_history:
+            del self.history[0]
+        if self._csv is not None:
+            self._csv.writerow([self.frame, f"{sum(sample.values()):.3f}"] + [f"{sample[k]:.3f}" for k in self.STAGES])
+        self.frame += 1
+
+    def draw_overlay(self, screen, font):
+        # One stacked bar per recent frame (1 px per ms), with a line at the FPS_CAP budget
+        x0, y0, bar_w = 10, HEIGHT - 10, 3
+        budget = 1000.0 / FPS_CAP
+        panel = pygame.Surface((self.max_history*bar_w + 120, 100 + 14*len(self.STAGES) + 6), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 140))
+        screen.blit(panel, (x0 - 4, y0 - panel.get_height() + 4))
+        pygame.draw.line(screen, (255, 255, 255), (x0, y0 - budget), (x0 + self.max_history*bar_w, y0 - budget), 1)
+        for i, sample in enumerate(self.history):
+            y = y0
+            for stage in self.STAGES:
+                h = sample[stage]
+                if h < 0.05: continue
+                pygame.draw.rect(screen, self.COLORS[stage], (x0 + i*bar_w, y - h, bar_w, h))
+                y -= h
+        # Legend with the average of the visible window
+        n = len(self.history) or 1
+        ly = y0 - 96 - 14*len(self.STAGES)
+        for stage in self.STAGES:
+            avg = sum(sample[stage] for sample in self.history) / n
+            pygame.draw.rect(screen, self.COLORS[stage], (x0 + self.max_history*bar_w + 8, ly + 3, 8, 8))
+            screen.blit(font.render(f"{stage} {avg:.1f} ms", True, (255,255,255)), (x0 + self.max_history*bar_w + 20, ly))
+            ly += 14
+
+    def close(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+
+class NullProfiler:
+    # Stand-in when nobody is profiling
+    def mark(self, stage): pass
+
+NULL_PROFILER = NullProfiler()
+
+# ---------- Render distance ----------
+class RenderDistance:
+    # Feedback controller for the render radius: after every RADIUS_WINDOW redrawn frames it
+    # compares their 75th percentile frame time with the 1/FPS_CAP budget and steps the radius
+    # by RADIUS_STEP. Hysteresis: nothing happens between RADIUS_GROW_BELOW and
+    # RADIUS_SHRINK_ABOVE of the budget, each step starts a fresh window (new meshes make the
+    # first frames after one slow), and growing waits some windows after a shrink: three, doubled
+    # every time a growth has to be taken back straight away
+    def __init__(self, radius=RENDER_RADIUS):
+        self.radius = radius
+        self.state = "hold"  # last decision, for the HUD
+        self.last_ms = 0.0   # 75th percentile of the last full window
+        self.samples = []
+        self.grow_wait = 0   # windows to go before growing is allowed again
+        self.backoff = 3
+
+    def update(self, frame_ms):
+        self.samples.append(frame_ms)
+        if len(self.samples) < RADIUS_WINDOW: return
+        self.last_ms = sorted(self.samples)[len(self.samples) * 3 // 4]
+        self.samples = []
+        budget = 1000.0 / FPS_CAP
+        self.grow_wait = max(self.grow_wait - 1, 0)
+        if self.last_ms > budget * RADIUS_SHRINK_ABOVE and self.radius > RADIUS_MIN:
+            self.radius = max(self.radius - RADIUS_STEP, RADIUS_MIN)
+            self.backoff = min(self.backoff * 2, 64) if self.state == "grow" else 3
+            self.grow_wait = self.backoff
+            self.state = "shrink"
+        elif self.last_ms < budget * RADIUS_GROW_BELOW and self.radius < RADIUS_MAX and not self.grow_wait:
+            self.radius = min(self.radius + RADIUS_STEP, RADIUS_MAX)
+            self.state = "grow"
         else:
-            if tMaxY < tMaxZ:
-                y += stepY
-                t = tMaxY
-                tMaxY += tDeltaY
-                face = (0, -stepY, 0)
-            else:
-                z += stepZ
-                t = tMaxZ
-                tMaxZ += tDeltaZ
-                face = (0, 0, -stepZ)
-    return None
+            self.state = "hold"
 
 # ---------- Main loop ----------
-def main():
+def draw_sky(screen):
+    screen.fill((140, 190, 255))  # sky
+    # Simple horizon ground fill far away
+    pygame.draw.rect(screen, (90, 160, 90), (0, HEIGHT*0.55, WIDTH, HEIGHT*0.45))
+
+def main(record_path=None, profile_csv=None, save_dir=SAVE_DIR, sparse=SPARSE_WORLD, backend=RENDER_BACKEND):
+    # record_path: write the camera pose of every frame as JSON, replayable with --bench
+    # profile_csv: stream per-stage frame times to a CSV file
+    # save_dir: directory the world's edits are saved to (None = nothing is saved)
+    # sparse: store only edits and derive terrain on demand (see World)
+    # backend: "painter" or "zbuffer" (see render_world); F4 switches at runtime
     pygame.init()
     pygame.display.set_caption("Minimal Minecraft - Pygame")
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -363,138 +2227,281 @@ def main():
     pygame.mouse.set_visible(False)
 
     cam = Camera(pos=(0.0, 50.0, 0.0), yaw=45.0, pitch=-15.0)
-    world = World(WORLD_SEED)
+    world = open_world(save_dir, sparse) if save_dir else World(WORLD_SEED, sparse)
+    meshes = ChunkMeshCache(world, MeshWorkers() if MESH_WORKERS else None)
+    ticks = BlockTicks(world)
+    # Sparse worlds have nothing to generate ahead of time
+    generator = None if world.sparse else ChunkGenerator(world)
 
     vel = [0.0, 0.0, 0.0]
     on_ground = False
     selected_block = 1  # start with grass
 
+    recording = [] if record_path else None
+    prof = FrameProfiler(csv_path=profile_csv)
+    show_profiler = False
+    world_layer = pygame.Surface((WIDTH, HEIGHT)).convert()
+    layer_key = None  # (camera pose, backend, radius, world.version, meshes.version) world_layer was drawn for
+    distance = RenderDistance()
+    font = pygame.font.SysFont(None, 18)
     last_time = time.time()
     running = True
-    while running:
-        dt = clock.tick(FPS_CAP) / 1000.0
-        dt = min(dt, 0.05)
-
-        # Input
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
+    try:
+        while running:
+            dt = clock.tick(FPS_CAP) / 1000.0
+            dt = min(dt, 0.05)
+            prof.begin_frame()
+
+            # Input
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
                     running = False
-                elif pygame.K_1 <= event.key <= pygame.K_5:
-                    selected_block = (event.key - pygame.K_0)
-                elif event.key == pygame.K_f:
-                    # Toggle fly mode
-                    global FLY_MODE
-                    FLY_MODE = not FLY_MODE
-                    vel[1] = 0.0
-                elif event.key == pygame.K_r:
-                    # Reset position to spawn
-                    cam.x, cam.y, cam.z = 0.0, 60.0, 0.0
-                    vel = [0.0, 0.0, 0.0]
-            elif event.type == pygame.MOUSEMOTION:
-                mx, my = event.rel
-                cam.yaw = (cam.yaw + mx * MOUSE_SENS) % 360
-                cam.pitch = clamp(cam.pitch - my * MOUSE_SENS, -89.5, 89.5)
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                # Raycast from camera
-                fwd = cam.dir_forward()
-                hit = raycast_voxels(world, (cam.x, cam.y, cam.z), fwd, BUILD_REACH)
-                if event.button == 1:  # break
-                    if hit:
-                        hx, hy, hz, face, dist = hit
-                        world.set_block(hx, hy, hz, 0)
-                elif event.button == 3:  # place
-                    if hit:
-                        hx, hy, hz, face, dist = hit
-                        px, py, pz = hx + face[0], hy + face[1], hz + face[2]
-                        # do not place inside camera position
-                        if length(sub((px+0.5,py+0.5,pz+0.5),(cam.x,cam.y,cam.z))) > 1.0:
-                            world.set_block(px, py, pz, selected_block)
-
-        # Movement
-        keys = pygame.key.get_pressed()
-        ax = az = ay = 0.0
-        speed = MOVE_SPEED
-        if keys[pygame.K_LCTRL] or keys[pygame.K_c]:
-            speed *= 1.8
-        if keys[pygame.K_LSHIFT]:
-            speed *= 0.7
-
-        # Strafe directions based on yaw
-        yaw_rad = math.radians(cam.yaw)
-        siny, cosy = math.sin(yaw_rad), math.cos(yaw_rad)
-        forward = (siny, 0.0, cosy)
-        right = (cosy, 0.0, -siny)
-
-        if keys[pygame.K_w]:
-            ax += forward[0] * speed
-            az += forward[2] * speed
-        if keys[pygame.K_s]:
-            ax -= forward[0] * speed
-            az -= forward[2] * speed
-        if keys[pygame.K_a]:
-            ax -= right[0] * speed
-            az -= right[2] * speed
-        if keys[pygame.K_d]:
-            ax += right[0] * speed
-            az += right[2] * speed
-
-        if FLY_MODE:
-            if keys[pygame.K_SPACE]: ay += speed
-            if keys[pygame.K_LSHIFT]: ay -= speed
-            vel[0] = vel[0]*AIR_FRICTION + ax * dt
-            vel[1] = vel[1]*AIR_FRICTION + ay * dt
-            vel[2] = vel[2]*AIR_FRICTION + az * dt
-            cam.x += vel[0]
-            cam.y += vel[1]
-            cam.z += vel[2]
-        else:
-            # Basic ground physics without collision against blocks for simplicity
-            if keys[pygame.K_SPACE] and on_ground:
-                vel[1] = JUMP_SPEED
-                on_ground = False
-            vel[0] = vel[0]*AIR_FRICTION + ax * dt
-            vel[2] = vel[2]*AIR_FRICTION + az * dt
-            vel[1] -= GRAVITY * dt
-            cam.x += vel[0]
-            cam.z += vel[2]
-            cam.y += vel[1]
-            terrain_y = world.height_at(int(round(cam.x)), int(round(cam.z))) + 1.0
-            if cam.y < terrain_y:
-                cam.y = terrain_y
-                vel[1] = 0.0
-                on_ground = True
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        running = False
+                    elif pygame.K_1 <= event.key <= pygame.K_8:
+                        selected_block = (event.key - pygame.K_0)
+                    elif event.key == pygame.K_f:
+                        # Toggle fly mode
+                        global FLY_MODE
+                        FLY_MODE = not FLY_MODE
+                        vel[1] = 0.0
+                    elif event.key == pygame.K_r:
+                        # Reset position to spawn
+                        cam.x, cam.y, cam.z = 0.0, 60.0, 0.0
+                        vel = [0.0, 0.0, 0.0]
+                    elif event.key == pygame.K_F3:
+                        show_profiler = not show_profiler
+                    elif event.key == pygame.K_F4:
+                        backend = "zbuffer" if backend == "painter" else "painter"
+                    elif event.key == pygame.K_F5:
+                        world.save()
+                elif event.type == pygame.MOUSEMOTION:
+                    mx, my = event.rel
+                    cam.yaw = (cam.yaw + mx * MOUSE_SENS) % 360
+                    cam.pitch = clamp(cam.pitch - my * MOUSE_SENS, -89.5, 89.5)
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    # Raycast from camera
+                    fwd = cam.dir_forward()
+                    hit = raycast_voxels(world, (cam.x, cam.y, cam.z), fwd, BUILD_REACH)
+                    if event.button == 1:  # break
+                        if hit:
+                            hx, hy, hz, face, dist = hit
+                            world.set_block(hx, hy, hz, 0)
+                    elif event.button == 3:  # place
+                        if hit:
+                            hx, hy, hz, face, dist = hit
+                            px, py, pz = hx + face[0], hy + face[1], hz + face[2]
+                            # do not place inside the player
+                            box = player_box(cam)
+                            if not (box[0] < px+1 and px < box[3] and box[1] < py+1 and py < box[4] and box[2] < pz+1 and pz < box[5]):
+                                world.set_block(px, py, pz, selected_block)
+            prof.mark("input")
+
+            # Movement
+            keys = pygame.key.get_pressed()
+            ax = az = ay = 0.0
+            speed = MOVE_SPEED
+            if keys[pygame.K_LCTRL] or keys[pygame.K_c]:
+                speed *= 1.8
+            if keys[pygame.K_LSHIFT]:
+                speed *= 0.7
+
+            # Strafe directions based on yaw
+            yaw_rad = math.radians(cam.yaw)
+            siny, cosy = math.sin(yaw_rad), math.cos(yaw_rad)
+            forward = (siny, 0.0, cosy)
+            right = (cosy, 0.0, -siny)
+
+            if keys[pygame.K_w]:
+                ax += forward[0] * speed
+                az += forward[2] * speed
+            if keys[pygame.K_s]:
+                ax -= forward[0] * speed
+                az -= forward[2] * speed
+            if keys[pygame.K_a]:
+                ax -= right[0] * speed
+                az -= right[2] * speed
+            if keys[pygame.K_d]:
+                ax += right[0] * speed
+                az += right[2] * speed
+
+            if FLY_MODE:
+                if keys[pygame.K_SPACE]: ay += speed
+                if keys[pygame.K_LSHIFT]: ay -= speed
+                vel[0] = vel[0]*AIR_FRICTION + ax * dt
+                vel[1] = vel[1]*AIR_FRICTION + ay * dt
+                vel[2] = vel[2]*AIR_FRICTION + az * dt
+                cam.x += vel[0]
+                cam.y += vel[1]
+                cam.z += vel[2]
             else:
-                on_ground = False
+                # Walking: the player's box is swept against the blocks around it
+                if keys[pygame.K_SPACE] and on_ground:
+                    vel[1] = JUMP_SPEED
+                vel[0] = vel[0]*AIR_FRICTION + ax * dt
+                vel[2] = vel[2]*AIR_FRICTION + az * dt
+                vel[1] -= GRAVITY * dt
+                blocked = move_player(world, cam, (vel[0], vel[1] * dt, vel[2]))
+                on_ground = blocked[1] and vel[1] < 0
+                vel = [0.0 if hit else v for v, hit in zip(vel, blocked)]
+            # Let the camera come to rest instead of drifting by ever smaller amounts
+            vel = [v if abs(v) > 1e-4 else 0.0 for v in vel]
+            ticks.update(dt)
+            prof.mark("physics")
+
+            # Draw. The world layer is only redrawn when the view, the world or its meshes changed,
+            # or background work is still filling them in; otherwise last frame's is reused
+            if recording is not None:
+                recording.append([cam.x, cam.y, cam.z, cam.yaw, cam.pitch])
+            frame_key = (cam.x, cam.y, cam.z, cam.yaw, cam.pitch, backend, distance.radius, world.version, meshes.version)
+            redrawn = frame_key != layer_key or meshes.busy() or (generator is not None and generator.pending)
+            if redrawn:
+                layer_key = frame_key
+                draw_sky(world_layer)
+                render_world(world_layer, cam, world, int(cam.x), int(cam.z), meshes, generator, prof, backend, distance.radius)
+            screen.blit(world_layer, (0, 0))
+            prof.mark("draw")
 
-        # Draw
-        screen.fill((140, 190, 255))  # sky
-        # Simple horizon ground fill far away
-        pygame.draw.rect(screen, (90, 160, 90), (0, HEIGHT*0.55, WIDTH, HEIGHT*0.45))
+            # Crosshair
+            cx, cy = WIDTH//2, HEIGHT//2
+            pygame.draw.line(screen, (0,0,0), (cx-8, cy), (cx+8, cy), 3)
+            pygame.draw.line(screen, (0,0,0), (cx, cy-8), (cx, cy+8), 3)
+            pygame.draw.line(screen, (255,255,255), (cx-8, cy), (cx+8, cy), 1)
+            pygame.draw.line(screen, (255,255,255), (cx, cy-8), (cx, cy+8), 1)
 
-        render_world(screen, cam, world, int(cam.x), int(cam.z))
+            # HUD
+            fps = int(clock.get_fps())
+            text = font.render(f"FPS {fps}  Pos({cam.x:.1f},{cam.y:.1f},{cam.z:.1f})  Yaw {cam.yaw:.1f}  Pitch {cam.pitch:.1f}  Block [{selected_block}:{BLOCK_NAMES.get(selected_block,'?')}]", True, (0,0,0))
+            screen.blit(text, (10, 10))
+            status = f"Radius {distance.radius} ({distance.state}, p75 {distance.last_ms:.1f} ms)" if ADAPTIVE_RADIUS else f"Radius {distance.radius}"
+            screen.blit(font.render(status, True, (0,0,0)), (10, 26))
+            if show_profiler:
+                prof.draw_overlay(screen, font)
+            prof.mark("hud")
+            pygame.display.flip()
+            prof.mark("flip")
+            prof.end_frame()
+            # Only frames that drew the world say anything about what the radius costs
+            if redrawn and ADAPTIVE_RADIUS:
+                distance.update(sum(prof.history[-1].values()))
+    finally:
+        # Also after a crash (or Ctrl+C): stop the workers and keep the session's edits
+        if generator is not None:
+            generator.shutdown()
+        if meshes.workers is not None:
+            meshes.workers.shutdown()
+        prof.close()
+        world.save()
+        if world.store is not None:
+            world.store.close()
+        pygame.quit()
+    if recording is not None:
+        with open(record_path, "w") as f:
+            json.dump(recording, f)
+
+# ---------- Headless benchmark ----------
+def scripted_path(frames):
+    # Default camera path: fly forward over fresh terrain while turning and looking up and down
+    path = []
+    for t in range(frames):
+        x = t * 0.25
+        z = 20.0 * math.sin(t / 60.0)
+        yaw = (45.0 + t * 1.5) % 360
+        pitch = -25.0 - 15.0 * math.sin(t / 40.0)
+        path.append([x, 50.0, z, yaw, pitch])
+    return path
 
-        # Crosshair
-        cx, cy = WIDTH//2, HEIGHT//2
-        pygame.draw.line(screen, (0,0,0), (cx-8, cy), (cx+8, cy), 3)
-        pygame.draw.line(screen, (0,0,0), (cx, cy-8), (cx, cy+8), 3)
-        pygame.draw.line(screen, (255,255,255), (cx-8, cy), (cx+8, cy), 1)
-        pygame.draw.line(screen, (255,255,255), (cx, cy-8), (cx, cy+8), 1)
+def percentiles(values):
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "mean": round(float(arr.mean()), 3),
+        "max": round(float(arr.max()), 3),
+    }
 
-        # HUD
-        fps = int(clock.get_fps())
-        font = pygame.font.SysFont(None, 18)
-        text = font.render(f"FPS {fps}  Pos({cam.x:.1f},{cam.y:.1f},{cam.z:.1f})  Yaw {cam.yaw:.1f}  Pitch {cam.pitch:.1f}  Block [{selected_block}:{BLOCK_NAMES.get(selected_block,'?')}]", True, (0,0,0))
-        screen.blit(text, (10, 10))
-        pygame.display.flip()
+def benchmark(path_file=None, frames=300, seed=WORLD_SEED, backend=RENDER_BACKEND):
+    # Replays a camera path on SDL's dummy driver into an offscreen Surface. Terrain is
+    # generated synchronously so every run of the same path and seed does identical work
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    if path_file:
+        with open(path_file) as f:
+            path = json.load(f)
+    else:
+        path = scripted_path(frames)
+
+    def run(trace_alloc):
+        screen = pygame.Surface((WIDTH, HEIGHT))
+        world = World(seed)
+        meshes = ChunkMeshCache(world)
+        cam = Camera()
+        prof = FrameProfiler(history=len(path))
+        times, faces, allocs = [], [], []
+        for x, y, z, yaw, pitch in path:
+            cam.x, cam.y, cam.z, cam.yaw, cam.pitch = x, y, z, yaw, pitch
+            if trace_alloc:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            blocks = sys.getallocatedblocks()
+            t0 = time.perf_counter()
+            prof.begin_frame()
+            draw_sky(screen)
+            n = render_world(screen, cam, world, int(cam.x), int(cam.z), meshes, prof=prof, backend=backend)
+            prof.end_frame()
+            times.append((time.perf_counter() - t0) * 1000.0)
+            faces.append(n)
+            if trace_alloc:
+                allocs.append((tracemalloc.get_traced_memory()[1] - base) / 1024.0)
+            else:
+                allocs.append(sys.getallocatedblocks() - blocks)
+        stages = {k: percentiles([f[k] for f in prof.history]) for k in ("populate", "gather", "project", "sort", "draw")}
+        return times, faces, allocs, stages
 
+    times, faces, blocks, stages = run(False)
+    # Second pass under tracemalloc, kept out of the timings because tracing is slow
+    tracemalloc.start()
+    _, _, peak_kb, _ = run(True)
+    tracemalloc.stop()
     pygame.quit()
+    return {
+        "seed": seed,
+        "frames": len(path),
+        "path": path_file or "scripted",
+        "backend": backend,
+        "frame_ms": percentiles(times),
+        "first_frame_ms": round(times[0], 3),
+        "stage_ms": stages,
+        "faces_drawn": percentiles(faces),
+        "alloc_blocks_net": percentiles(blocks),
+        "alloc_peak_kb": percentiles(peak_kb),
+    }
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal Minecraft - Pygame")
+    parser.add_argument("--record", metavar="PATH", help="record the camera path to a JSON file")
+    parser.add_argument("--world", metavar="DIR", default=SAVE_DIR, help="save directory for block edits (default: %(default)s)")
+    parser.add_argument("--no-save", action="store_true", help="do not load or save edits")
+    parser.add_argument("--sparse", action="store_true", help="keep only edits in memory and derive terrain on demand")
+    parser.add_argument("--profile-csv", metavar="PATH", help="stream per-stage frame times to a CSV file")
+    parser.add_argument("--bench", action="store_true", help="run the headless renderer benchmark and print JSON")
+    parser.add_argument("--path", metavar="PATH", help="camera path for --bench (default: built-in scripted path)")
+    parser.add_argument("--frames", type=int, default=300, help="frames of the scripted path for --bench")
+    parser.add_argument("--seed", type=int, default=WORLD_SEED, help="world seed for --bench")
+    parser.add_argument("--backend", choices=("painter", "zbuffer"), default=RENDER_BACKEND, help="renderer (default: %(default)s)")
+    parser.add_argument("--out", metavar="PATH", help="also write the --bench JSON report to a file")
+    args = parser.parse_args()
+    if args.bench:
+        report = json.dumps(benchmark(args.path, args.frames, args.seed, args.backend), indent=2)
+        print(report)
+        if args.out:
+            with open(args.out, "w") as f:
+                f.write(report + "\n")
+        sys.exit(0)
     try:
-        main()
+        main(args.record, args.profile_csv, None if args.no_save else args.world, args.sparse or SPARSE_WORLD, args.backend)
     except Exception as e:
         pygame.quit()
         raise
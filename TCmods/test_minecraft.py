@@ -0,0 +1,48 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import minecraft as mc
+
+
+def test_region_store_keeps_every_chunk_of_a_region(tmp_path):
+    store = mc.RegionStore(str(tmp_path))
+    chunks = {(cx, cz): bytearray([cx * 8 + cz + 1]) * mc.CHUNK_VOLUME for cx in range(3) for cz in range(2)}
+    for (cx, cz), data in chunks.items():
+        store.write(cx, cz, data)
+    store.write(0, 0, chunks[(0, 0)])  # rewriting a saved chunk reuses its slot
+    store.close()
+    store = mc.RegionStore(str(tmp_path))
+    for (cx, cz), data in chunks.items():
+        assert store.read(cx, cz) == data
+    store.close()
+
+
+def test_saved_edits_survive_reopening(tmp_path):
+    for sparse in (False, True):
+        directory = str(tmp_path / str(sparse))
+        world = mc.open_world(directory, sparse)
+        rng = random.Random(1)
+        edits = {}
+        for _ in range(500):
+            x, y, z = rng.randrange(-40, 40), rng.randrange(20, 60), rng.randrange(-40, 40)
+            bid = rng.randrange(0, 6)
+            world.set_block(x, y, z, bid)
+            edits[(x, y, z)] = bid
+        world.save()
+        world.store.close()
+        world = mc.open_world(directory, sparse)
+        for x, _, z in edits:
+            world.ensure_chunk(x >> mc.CHUNK_SHIFT, z >> mc.CHUNK_SHIFT)
+        assert {pos: world.get_block(*pos) for pos in edits} == edits
+        world.store.close()
+
+
+def test_clone_from_ungenerated_terrain_matches_sparse_world():
+    dense, sparse = mc.World(mc.WORLD_SEED), mc.World(mc.WORLD_SEED, sparse=True)
+    for world in (dense, sparse):
+        world.fill(((0, 30, 0), (3, 40, 3)), 4)
+        world.clone(((100, 20, 100), (130, 60, 120)), (-20, 30, -20))
+    for key, data in dense.chunks.items():
+        assert sparse.chunk_data(*key) == data